@@ -1,31 +1,21 @@
-import glob
 import random
 import string
 import os
 
-path_to = "./unprocessed_raw/"
-
-bin_files = [x.split('/')[-1] for x in glob.glob(f"{path_to}*.bin")]
-cal_files = [x.split('/')[-1] for x in glob.glob(f"{path_to}*.cal")]
+from recording_catalog import default_recording_catalog
 
-# print(bin_files)
-# print(cal_files)
+path_to = "./unprocessed_raw/"
 
 # Find matching pairs
 
 pairs = []
+unpaired = default_recording_catalog.unpaired(path_to)
 
-# O(n^2) ewwwwww
-for bix, b in enumerate(bin_files):
-    common_part = b[0:-4]
-    matching_cal_name = f"{common_part}_CD.cal"
-    for idx, c in enumerate(cal_files):
-        if c == matching_cal_name:
-            print(f"Found pair: {c} {b}")
-            pairs.append((b, c,))
-            bin_files[bix] = "USED UP NAME"
-            cal_files[idx] = "USED UP NAME"
-            break
+for r in default_recording_catalog.records(path_to):
+    b = r["data_path"].split('/')[-1]
+    c = r["calibration_path"].split('/')[-1]
+    print(f"Found pair: {c} {b}")
+    pairs.append((b, c,))
 
 # Rename pairs
 
@@ -45,10 +35,5 @@ for p in pairs:
 
 print("Deleting unrenamed")
 
-for b in bin_files:
-    if b != "USED UP NAME":
-        os.remove(f"{path_to}{b}")
-
-for b in cal_files:
-    if b != "USED UP NAME":
-        os.remove(f"{path_to}{b}")
\ No newline at end of file
+for b in unpaired:
+    os.remove(f"{path_to}{b}")
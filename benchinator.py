@@ -0,0 +1,411 @@
+# Benchmarks the array based hot paths against the original list based implementations.
+# Real recordings are not distributed with the code, so synthetic ones are generated instead.
+import time
+from collections import deque
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from e2e_detectors import detect_threshold, geq_sign_invariant, E2EThreshold
+from impact_detection import chunks, find_impacts
+from sensor_data_types import WristSample, SampleBlock, ARM_GYRO, ARM_ACC, PALM_GYRO, PALM_ACC, \
+    wristSample2sktimeData, wristSample2panel
+from swing_data_instance import skd_post_process, skd_array_post_process, PalmGyroNormSynth, ArmGyroNormSynth, \
+    PalmAccDifSynth, sktimeData2panel
+
+
+def synthetic_recording(length: int, seed: int = 0) -> SampleBlock:
+    rng = np.random.default_rng(seed)
+    data = np.empty((length, 12), dtype='float64')
+    data[:, ARM_GYRO] = rng.normal(0, 25, (length, 3))
+    data[:, ARM_ACC] = rng.normal(0, 1, (length, 3))
+    data[:, PALM_GYRO] = rng.normal(0, 25, (length, 3))
+    data[:, PALM_ACC] = rng.normal(0, 1, (length, 3))
+    # Sprinkle in impact-like spikes
+    impacts = rng.choice(length, size=max(1, length // 500), replace=False)
+    data[impacts, PALM_ACC] += rng.normal(0, 15, (len(impacts), 3))
+    data[impacts, ARM_GYRO] += rng.normal(0, 80, (len(impacts), 3))
+    data[impacts, PALM_GYRO] += rng.normal(0, 80, (len(impacts), 3))
+    return SampleBlock(data)
+
+
+def best_time(fn: Callable, repeat: int = 3) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def print_comparison(name: str, original: float, new: float):
+    print(f"{name}: original {original * 1000:.3f} ms, new {new * 1000:.3f} ms, speedup {original / new:.1f}x")
+
+
+# Copy of impact_detection.find_impacts before it was vectorized
+def find_impacts_original(samples: list[WristSample],
+                          palmVibrationThreshold: float = 1,
+                          armGyroNormThreshold: float = 30,
+                          minSpacing: int = 100) -> list[int]:
+    impacts: list[(float, int)] = []
+    for w, idxs in chunks(samples, minSpacing):
+        w_acc_norms = []
+        w_gyro_norms = []
+        for i, s in enumerate(w):
+            w_acc_norms.append(np.linalg.norm(s['palm_acc']))
+            w_gyro_norms.append(np.linalg.norm(s['arm_gyro']))
+
+        current_peak_idx = -1
+        current_peak_value = -1
+        for i in range(len(w_acc_norms)):
+            if (w_acc_norms[i] > palmVibrationThreshold) and (w_gyro_norms[i] > armGyroNormThreshold):
+                if w_acc_norms[i] > current_peak_value:
+                    current_peak_value = w_acc_norms[i]
+                    current_peak_idx = i
+
+        if current_peak_idx != -1:
+            impacts.append((current_peak_value, current_peak_idx + idxs[0]))
+
+    impacts.sort(key=lambda x: x[0], reverse=True)
+    return list(map(lambda x: x[1], impacts))
+
+
+def bench_find_impacts():
+    block = synthetic_recording(200000)
+    samples = block.to_wrist_samples()
+    for spacing in [1, 37, 100]:
+        assert find_impacts(block, minSpacing=spacing) == find_impacts_original(samples, minSpacing=spacing)
+    original = best_time(lambda: find_impacts_original(samples), repeat=1)
+    new = best_time(lambda: find_impacts(block))
+    print_comparison(f"find_impacts ({len(block)} samples)", original, new)
+
+
+# Copy of e2e_detectors.detect_threshold before it was vectorized
+def detect_threshold_original(impact_window: list[WristSample],
+                              palm_vibration_threshold: float = 2,
+                              arm_gyro_x_threshold: float | None = 40,
+                              palm_gyro_z_dif_threshold: float | None = None) -> int | None:
+    w_acc_dif_norms = []
+    w_gyro_x_vals = []
+    w_gyro_z_difs = []
+    last_acc = None
+    last_gyro_z = None
+    for i, s in enumerate(impact_window):
+        acc = s['palm_acc']
+        if last_acc is None:
+            last_acc = acc
+            last_gyro_z = s['palm_gyro'][2]
+        w_acc_dif_norms.append(np.linalg.norm([acc[0] - last_acc[0], acc[1] - last_acc[1], acc[2] - last_acc[2]]))
+        w_gyro_z_difs.append(s['palm_gyro'][2] - last_gyro_z)
+        w_gyro_x_vals.append(s['arm_gyro'][0])
+        last_acc = s['palm_acc']
+        last_gyro_z = s['palm_gyro'][2]
+
+    current_peak_idx = None
+    current_peak_value = -9999999
+    for i in range(len(w_acc_dif_norms)):
+        if (w_acc_dif_norms[i] >= palm_vibration_threshold) \
+                and (True if arm_gyro_x_threshold is None else w_gyro_x_vals[i] >= arm_gyro_x_threshold):
+            if palm_gyro_z_dif_threshold is None:
+                score = w_acc_dif_norms[i]
+            elif geq_sign_invariant(w_gyro_z_difs[i], palm_gyro_z_dif_threshold):
+                score = w_acc_dif_norms[i] * 20 + w_gyro_x_vals[i] * 0 + w_gyro_z_difs[i] * -1
+            else:
+                continue
+            if score > current_peak_value:
+                current_peak_value = score
+                current_peak_idx = i
+
+    if current_peak_idx is None:
+        return None
+    return len(impact_window) - current_peak_idx
+
+
+def bench_detect_threshold():
+    block = synthetic_recording(100000, seed=1)
+    samples = block.to_wrist_samples()
+    # Putting and full swing settings used by the detectors
+    modes = [{"palm_vibration_threshold": 1.75, "arm_gyro_x_threshold": 23},
+             {"palm_vibration_threshold": 6, "arm_gyro_x_threshold": None, "palm_gyro_z_dif_threshold": -100},
+             {"palm_vibration_threshold": 2, "arm_gyro_x_threshold": 40, "palm_gyro_z_dif_threshold": 10}]
+    window_size = 50
+    starts = range(0, len(block) - window_size, 37)
+    for m in modes:
+        for s in starts:
+            expected = detect_threshold_original(samples[s:s + window_size], **m)
+            assert detect_threshold(block.data[s:s + window_size], **m) == expected
+        original = best_time(lambda: [detect_threshold_original(samples[s:s + window_size], **m) for s in starts])
+        new = best_time(lambda: [detect_threshold(block.data[s:s + window_size], **m) for s in starts])
+        print_comparison(f"detect_threshold per call {m}", original / len(starts), new / len(starts))
+
+
+# Copy of E2EThreshold before it kept running features
+class E2EThresholdOriginal:
+    def __init__(self, window_size: int = 50, cooldown_period: int = 75, **thresholds):
+        self.buffer = deque([])
+        self.sample_count = 0
+        self.window_size = window_size
+        self.window_period = (self.window_size // 4) * 3
+        self.next_window = self.window_period
+        self.cooldown_period = cooldown_period
+        self.cooldown_timer = 0
+        self.thresholds = thresholds
+
+    def iterate_impact(self) -> int | None:
+        self.next_window -= 1
+        self.sample_count += 1
+        if self.cooldown_timer > 0:
+            self.cooldown_timer -= 1
+            return None
+        if self.next_window <= 0:
+            self.next_window = self.window_period
+            if len(self.buffer) < self.window_size:
+                return None
+            return detect_threshold_original(list(self.buffer)[(len(self.buffer) - self.window_size):],
+                                             **self.thresholds)
+        return None
+
+    def add_sample(self, sample: WristSample) -> int | None:
+        self.buffer.append(sample)
+        if len(self.buffer) > (self.window_size * 2):
+            self.buffer.popleft()
+        imp_result = self.iterate_impact()
+        if imp_result is not None:
+            self.cooldown_timer = self.cooldown_period
+            return self.sample_count - imp_result
+        return None
+
+
+def run_detector(detector, samples) -> list[int]:
+    detections = []
+    for sample in samples:
+        result = detector.add_sample(sample)
+        if result is not None:
+            detections.append(result)
+    return detections
+
+
+def bench_threshold_detector():
+    samples = synthetic_recording(50000, seed=2).to_wrist_samples()
+    # Threshold settings used in splitinator
+    configs = [{"palm_vibration_threshold": 20, "arm_gyro_x_threshold": None, "palm_gyro_z_dif_threshold": -100,
+                "window_size": 80, "cooldown_period": 100},
+               {"palm_vibration_threshold": 2.5, "arm_gyro_x_threshold": 30,
+                "window_size": 80, "cooldown_period": 100}]
+    for c in configs:
+        expected = run_detector(E2EThresholdOriginal(**c), samples)
+        assert run_detector(E2EThreshold(**c), samples) == expected
+        original = best_time(lambda: run_detector(E2EThresholdOriginal(**c), samples), repeat=1)
+        new = best_time(lambda: run_detector(E2EThreshold(**c), samples))
+        print_comparison(f"E2EThreshold ({len(samples)} samples, {len(expected)} detections)", original, new)
+
+
+def nested_inference_data(windows: list[SampleBlock], synthesize_dimensions, dimensions_to_remove) -> pd.DataFrame:
+    data = pd.concat([wristSample2sktimeData(w) for w in windows], ignore_index=True)
+    return skd_post_process(data, [8 for _ in windows],
+                            synthesize_dimensions=synthesize_dimensions,
+                            dimensions_to_remove=dimensions_to_remove)
+
+
+def array_inference_data(windows: list[SampleBlock], synthesize_dimensions, dimensions_to_remove) -> np.ndarray:
+    return skd_array_post_process(wristSample2panel(windows),
+                                  synthesize_dimensions=synthesize_dimensions,
+                                  dimensions_to_remove=dimensions_to_remove)[0]
+
+
+def bench_inference_data():
+    recording = synthetic_recording(3000, seed=3)
+    windows = [recording[i:i + 150] for i in range(0, 1500, 50)]
+    synths = [PalmAccDifSynth(), ArmGyroNormSynth(), PalmGyroNormSynth()]
+    removed = ["arm_acc_x", "arm_acc_y", "arm_acc_z", "palm_gyro_norm"]
+    expected = nested_inference_data(windows, synths, removed)
+    got = array_inference_data(windows, synths, removed)
+    assert got.shape == (len(windows), len(expected.columns), 150)
+    for c, name in enumerate(expected.columns):
+        for i in range(len(windows)):
+            assert np.array_equal(expected.iat[i, c].to_numpy(), got[i, c])
+
+    original = best_time(lambda: nested_inference_data(windows[:1], synths, removed))
+    new = best_time(lambda: array_inference_data(windows[:1], synths, removed))
+    print_comparison("Inference data for one window", original, new)
+
+    try:
+        from sktime.transformations.panel.rocket import MiniRocketMultivariate
+        rocket = MiniRocketMultivariate(random_state=0).fit(expected)
+    except ModuleNotFoundError as e:
+        print(f"Skipping MiniRocket comparison: {e}")
+        return
+    assert np.array_equal(np.asarray(rocket.transform(expected)), np.asarray(rocket.transform(got)))
+    original = best_time(lambda: rocket.transform(nested_inference_data(windows[:1], synths, removed)))
+    new = best_time(lambda: rocket.transform(array_inference_data(windows[:1], synths, removed)))
+    print_comparison("Inference data + MiniRocket transform for one window", original, new)
+
+
+# Copies of the DimensionSynth.get_series implementations before they were vectorized
+def palm_gyro_norm_original(src) -> pd.Series:
+    palm_x: pd.Series = src.palm_gyro_x
+    palm_y: pd.Series = src.palm_gyro_y
+    palm_z: pd.Series = src.palm_gyro_z
+
+    values = []
+    for i in range(len(palm_x)):
+        values.append(np.linalg.norm([palm_x[i], palm_y[i], palm_z[i]]))
+
+    return pd.Series(data=values, dtype='float64')
+
+
+def arm_gyro_norm_original(src) -> pd.Series:
+    arm_x: pd.Series = src.arm_gyro_x
+    arm_y: pd.Series = src.arm_gyro_y
+    arm_z: pd.Series = src.arm_gyro_z
+
+    values = []
+    for i in range(len(arm_x)):
+        values.append(np.linalg.norm([arm_x[i], arm_y[i], arm_z[i]]))
+
+    return pd.Series(data=values, dtype='float64')
+
+
+def palm_acc_dif_original(src) -> pd.Series:
+    palm_x: pd.Series = src.palm_acc_x
+    palm_y: pd.Series = src.palm_acc_y
+    palm_z: pd.Series = src.palm_acc_z
+
+    values = []
+    last_acc = None
+    for i in range(len(palm_x)):
+        if last_acc is not None:
+            values.append(np.linalg.norm(
+                [palm_x[i] - last_acc[0],
+                 palm_y[i] - last_acc[1],
+                 palm_z[i] - last_acc[2]]))
+
+        if len(values) == 1:
+            values.append(values[0])
+        last_acc = [palm_x[i], palm_y[i], palm_z[i]]
+
+    return pd.Series(data=values, dtype='float64')
+
+
+def synthesize_original(df: pd.DataFrame) -> list[list[pd.Series]]:
+    columns = []
+    for fn in [palm_acc_dif_original, arm_gyro_norm_original, palm_gyro_norm_original]:
+        columns.append([fn(r) for r in df.itertuples(index=False)])
+    return columns
+
+
+def synthesize_panel(df: pd.DataFrame) -> list[list[pd.Series]]:
+    return [d.get_column(df) for d in [PalmAccDifSynth(), ArmGyroNormSynth(), PalmGyroNormSynth()]]
+
+
+def bench_dimension_synth():
+    # 500 snippets of 300 samples, like a split with 500 snippets per class
+    recording = synthetic_recording(500 * 300, seed=4)
+    df = pd.concat([wristSample2sktimeData(recording[i:i + 300]) for i in range(0, 500 * 300, 300)],
+                   ignore_index=True)
+    expected = synthesize_original(df)
+    got = synthesize_panel(df)
+    for e_column, g_column in zip(expected, got):
+        for e, g in zip(e_column, g_column):
+            assert np.array_equal(e.to_numpy(), g.to_numpy())
+    # Per-row wrapper has to match too
+    for e, r in zip(expected[0][:20], df.itertuples(index=False)):
+        assert np.array_equal(e.to_numpy(), PalmAccDifSynth().get_series(r).to_numpy())
+
+    original = best_time(lambda: synthesize_original(df), repeat=1)
+    new = best_time(lambda: synthesize_panel(df))
+    print_comparison(f"Synthesizing 3 dimensions for {len(df)} snippets", original, new)
+
+
+# Copy of swing_data_instance.skd_post_process before it worked on arrays
+def skd_post_process_original(df: pd.DataFrame, cl: list[int],
+                              crop_series_rows: slice = None,
+                              synthesize_dimensions=[],
+                              classes_to_remove: list[int] = [],
+                              class_remap={},
+                              dimensions_to_remove: list[str] = []) -> pd.DataFrame:
+    cf = df
+
+    for idx, c in enumerate(cl):
+        if c in class_remap.keys():
+            cl[idx] = class_remap[c]
+
+    idx_to_remove = []
+    for idx, c in enumerate(cl):
+        if c in classes_to_remove:
+            idx_to_remove.append(idx)
+
+    cf = cf.drop(idx_to_remove, axis=0)
+
+    idx_to_remove.sort(reverse=True)
+    for idx in idx_to_remove:
+        cl.pop(idx)
+
+    if crop_series_rows is not None:
+        # DataFrame.applymap is called map in newer pandas
+        elementwise = cf.applymap if hasattr(cf, "applymap") else cf.map
+        cf = elementwise(lambda x: pd.Series(data=x.tolist()[crop_series_rows]))
+
+    for d in synthesize_dimensions:
+        new_column_name = d.get_name()
+        new_column = []
+        for r in cf.itertuples(index=False):
+            new_column.append(d.get_series(r))
+        cf.insert(0, new_column_name, new_column)
+
+    cf = cf.drop(dimensions_to_remove, axis=1)
+
+    return cf
+
+
+def bench_post_process():
+    recording = synthetic_recording(1000 * 300, seed=5)
+    df = pd.concat([wristSample2sktimeData(recording[i:i + 300]) for i in range(0, 1000 * 300, 300)],
+                   ignore_index=True)
+    classes = np.random.default_rng(5).integers(0, 9, len(df)).tolist()
+    # Settings of the putting classifier in splitinator
+    settings = {"crop_series_rows": slice(100, 225),
+                "synthesize_dimensions": [PalmAccDifSynth(), ArmGyroNormSynth()],
+                "classes_to_remove": [5, 6, 7],
+                "class_remap": {1: 0, 2: 0, 3: 0, 4: 0},
+                "dimensions_to_remove": ["arm_acc_x", "arm_acc_y", "arm_acc_z",
+                                         "palm_acc_x", "palm_acc_y", "palm_acc_z"]}
+
+    expected_classes = list(classes)
+    expected = skd_post_process_original(df, expected_classes, **settings)
+    got_classes = list(classes)
+    got = skd_post_process(df, got_classes, **settings)
+    assert got_classes == expected_classes
+    assert list(got.columns) == list(expected.columns)
+    assert got.index.equals(expected.index)
+    for c in range(len(expected.columns)):
+        for i in range(len(expected)):
+            assert np.array_equal(expected.iat[i, c].to_numpy(), got.iat[i, c].to_numpy())
+    panel, panel_classes = skd_array_post_process(sktimeData2panel(df), classes, channels=list(df.columns), **settings)
+    assert panel_classes.tolist() == expected_classes
+    assert np.array_equal(panel, sktimeData2panel(expected))
+
+    original = best_time(lambda: skd_post_process_original(df, list(classes), **settings), repeat=1)
+    new = best_time(lambda: skd_post_process(df, list(classes), **settings))
+    # The DataFrame wrapper is only kept for compatibility, most of its time goes to the nested frames
+    print_comparison(f"skd_post_process (DataFrame wrapper) on {len(df)} snippets", original, new)
+    panel = sktimeData2panel(df)
+    new = best_time(lambda: skd_array_post_process(panel, classes, channels=list(df.columns), **settings))
+    print_comparison(f"skd_array_post_process on {len(df)} snippets", original, new)
+
+
+benchmarks: list[Callable[[], None]] = [
+    bench_find_impacts,
+    bench_detect_threshold,
+    bench_threshold_detector,
+    bench_inference_data,
+    bench_dimension_synth,
+    bench_post_process
+]
+
+if __name__ == "__main__":
+    for b in benchmarks:
+        b()
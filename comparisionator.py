@@ -21,7 +21,8 @@ import csv
 
 from e2e_detectors import E2ERocketPuttingIsolation, E2ERocketFullSwingIsolation, E2EDetector, E2ERocketFullSwingPrime, \
     E2ERocketPuttingPrime
-from e2e_runner import E2ERunner, save_results, execute_runner
+from e2e_runner import save_results
+from sweep import SweepAxis, SweepTarget, sweep_runners, run_sweep
 from swing_data_instance import PalmAccDifSynth, ArmGyroNormSynth, PalmGyroNormSynth, DimensionSynth
 
 
@@ -103,57 +104,27 @@ if __name__ == "__main__":
                          "Aplami neg.", "Precizitate", "Parklajums"])
 
     # Iniciet visus E2ERunner
-    splits: list[str] = []
-    splits_readable: list[str] = []
+    splits: list[tuple[str, dict]] = []
     split_sizes = [20, 500]
     split_folds = [5, 5]
     for idx, size in enumerate(split_sizes):
         for fold in range(split_folds[idx]):
-            splits.append(f"split_final_{size}_F{fold}.pck")
-            splits_readable.append(f"{size}-{fold}")
-
-    runners: list[E2ERunner] = []
-
-    for spl_idx, spl in enumerate(splits):
-        for s in all_slices:
-            name = f"Fragments {s.start}-{s.stop} (spl {splits_readable[spl_idx]})"
-            runners.append(E2ERunner(name=name, dataset="fs_right_off",
-                                     detector_builder_2=get_full_swing_rocket_with,
-                                     db2_args={"crop": s, "split": spl}))
-            runners.append(E2ERunner(name=name, dataset="put_right_off",
-                                     detector_builder_2=get_putting_rocket_with,
-                                     db2_args={"crop": s, "split": spl}))
-
-        for dr in all_dimensions_to_remove:
-            name = f"Dimensijas {dr[0]} (spl {splits_readable[spl_idx]})"
-            runners.append(E2ERunner(name=name, dataset="fs_right_off",
-                                     detector_builder_2=get_full_swing_rocket_with,
-                                     db2_args={"dimensions_to_remove": dr[1], "split": spl}))
-            runners.append(E2ERunner(name=name, dataset="put_right_off",
-                                     detector_builder_2=get_putting_rocket_with,
-                                     db2_args={"dimensions_to_remove": dr[1], "split": spl}))
-
-        for ds in all_dimension_synths:
-            name = f"Papild {ds.get_name()} (spl {splits_readable[spl_idx]})"
-            runners.append(E2ERunner(name=name, dataset="fs_right_off",
-                                     detector_builder_2=get_full_swing_rocket_with,
-                                     db2_args={"dimensions_to_remove": all_dimensions,
-                                               "synthesize_dimensions": [ds],
-                                               "split": spl}))
-            runners.append(E2ERunner(name=name, dataset="put_right_off",
-                                     detector_builder_2=get_putting_rocket_with,
-                                     db2_args={"dimensions_to_remove": all_dimensions,
-                                               "synthesize_dimensions": [ds],
-                                               "split": spl}))
-
-        for ws in all_window_sizes:
-            name = f"Loga izm. {ws} (spl {splits_readable[spl_idx]})"
-            runners.append(E2ERunner(name=name, dataset="fs_right_off",
-                                     detector_builder_2=get_full_swing_rocket_with,
-                                     db2_args={"window_size": ws, "split": spl}))
-            runners.append(E2ERunner(name=name, dataset="put_right_off",
-                                     detector_builder_2=get_putting_rocket_with,
-                                     db2_args={"window_size": ws, "split": spl}))
+            splits.append((f"spl {size}-{fold}", {"split": f"split_final_{size}_F{fold}.pck"}))
+
+    targets: list[SweepTarget] = [
+        {"dataset": "fs_right_off", "builder": get_full_swing_rocket_with},
+        {"dataset": "put_right_off", "builder": get_putting_rocket_with}
+    ]
+    axes: list[SweepAxis] = [
+        {"title": "Fragments", "values": [(f"{s.start}-{s.stop}", {"crop": s}) for s in all_slices]},
+        {"title": "Dimensijas", "values": [(dr[0], {"dimensions_to_remove": dr[1]})
+                                           for dr in all_dimensions_to_remove]},
+        {"title": "Papild", "values": [(ds.get_name(), {"dimensions_to_remove": all_dimensions,
+                                                        "synthesize_dimensions": [ds]})
+                                       for ds in all_dimension_synths]},
+        {"title": "Loga izm.", "values": [(f"{ws}", {"window_size": ws}) for ws in all_window_sizes]}
+    ]
+    runners = sweep_runners(targets, axes, grid=[splits])
 
     # Iniciet multiprocessing
     pool = ctx.Pool(processes=4)
@@ -162,8 +133,7 @@ if __name__ == "__main__":
     # for id, r in enumerate(runners):
     #
     #    save_results(id, r, results)
-    processes = [pool.apply_async(execute_runner, args=(id, r,)) for id, r in enumerate(runners)]
-    results = [p.get() for p in processes]
+    results = run_sweep(pool, runners)
 
     for r in results:
         save_results(csv_writer, r[0], r[1], r[2])
@@ -4,7 +4,6 @@ from typing import TypedDict
 import numpy as np
 from matplotlib import pyplot as plt
 
-import sensor_data_reader as sr
 from matplotlib.figure import Figure
 from matplotlib.axes import Axes
 from matplotlib.lines import Line2D
@@ -12,11 +11,11 @@ from matplotlib.backends.backend_tkagg import (
     FigureCanvasTkAgg, NavigationToolbar2Tk
 )
 
-from e2e import get_samples, get_calibration
-from sensor_data_types import CalibrationData, DominantHand, WornHand, WristSample
+from e2e import load_data
+from sensor_data_types import CalibrationData, DominantHand, WornHand, WristSample, SampleBlock
 from impact_detection import *
 import minigolf as mg
-import glob
+from recording_catalog import default_recording_catalog
 from swing_data_instance import *
 from visualization import plot_samples
 
@@ -50,7 +49,8 @@ ax_gyro_arm: Axes
 ax_accel_palm: Axes
 ax_gyro_palm: Axes
 
-current_snippets: list[list[WristSample]] = []
+current_snippets: list[SampleBlock] = []
+current_impacts: list[int | None] = []
 current_snippets_save_state: list[str] = []
 current_snippet_idx = 0
 
@@ -66,23 +66,11 @@ current_record_idx = 0
 
 def _load_unprocessed_list():
     global records, current_record_idx
-    path_to = "./unprocessed_raw/"
-    bin_files = [x.split('/')[-1] for x in glob.glob(f"{path_to}*.bin")]
-    cal_files = [x.split('/')[-1] for x in glob.glob(f"{path_to}*.cal")]
-    print(bin_files)
-    print(cal_files)
-    for bix, b in enumerate(bin_files):
-        common_part = b[0:-4]
-        matching_cal_name = f"{common_part}_CD.cal"
-        for idx, c in enumerate(cal_files):
-            if c == matching_cal_name:
-                records.append({
-                    "data_path": f"{path_to}{b}",
-                    "calibration_path": f"{path_to}{c}",
-                })
-                bin_files[bix] = "USED UP NAME"
-                cal_files[idx] = "USED UP NAME"
-                break
+    for r in default_recording_catalog.records("./unprocessed_raw/"):
+        records.append({
+            "data_path": r["data_path"],
+            "calibration_path": r["calibration_path"],
+        })
     current_record_idx = 0
 
 
@@ -126,13 +114,18 @@ def _load_current_record():
     filename = records[current_record_idx]["data_path"].split("/")[-1]
     file_sv.set(filename)
 
-    global current_snippets, current_snippet_idx, current_snippets_save_state
-    samples = get_samples(records[current_record_idx]["data_path"])
-    calibration = get_calibration(records[current_record_idx]["calibration_path"])
-    sr.apply_calibration(samples, calibration)
-    current_snippets = impacts2snippets(samples, find_impacts(samples))
+    global current_snippets, current_impacts, current_snippet_idx, current_snippets_save_state
+    samples = load_data(records[current_record_idx]["data_path"], records[current_record_idx]["calibration_path"])
+    current_snippets = []
+    current_impacts = []
+    # One impact at a time, so it's known which impact each snippet is for
+    for impact in find_impacts(samples):
+        for snippet in impacts2snippets(samples, [impact]):
+            current_snippets.append(snippet)
+            current_impacts.append(impact)
     if len(current_snippets) == 0:
         current_snippets = [samples]
+        current_impacts = [None]
         current_snippets_save_state = []
     else:
         current_snippets_save_state = [None for x in current_snippets]
@@ -232,15 +225,16 @@ def _save_current_snippet(swingType: SwingType | None,
                                         swingType,
                                         dominantHand,
                                         wornHand)
-    filename = sdi_save(sdi)
+    filename = sdi_save(sdi,
+                        source=records[current_record_idx]["data_path"].split("/")[-1],
+                        impact=current_impacts[current_snippet_idx])
     current_snippets_save_state[current_snippet_idx] = filename
 
 
 def _unsave_current_snippet():
     sp = current_snippets_save_state[current_snippet_idx]
-    print(f"Deleting {sp}...")
     current_snippets_save_state[current_snippet_idx] = None
-    os.remove(sp)
+    sdi_delete(sp)
 
 
 def _save_fs_right_off():
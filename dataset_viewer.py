@@ -85,9 +85,7 @@ def _previous_record():
 
 def _deactivate_record():
     global swing_paths, current_swing_idx
-    new_name = f"{swing_paths[current_swing_idx]}.deactivated"
-    print(f"Renaming {swing_paths[current_swing_idx]} to {new_name}")
-    os.rename(swing_paths[current_swing_idx], new_name)
+    sdi_deactivate(swing_paths[current_swing_idx])
 
 
 def _load_current_record():
@@ -1,11 +1,12 @@
-import glob
-import os
-import pickle
-from typing import TypedDict
+import bisect
+from typing import TypedDict, Iterator
 
 import sensor_data_reader as sr
-from e2e_detectors import E2ESwingMetadata
-from sensor_data_types import WristSample, CalibrationData
+from recording_cache import RecordingCache, default_recording_cache
+from recording_catalog import default_recording_catalog
+from sensor_data_types import WristSample, CalibrationData, SampleBlock
+
+default_block_size = 4096
 
 
 class DetectionDataRecord(TypedDict):
@@ -22,6 +23,13 @@ class E2ERecordResult(TypedDict):
     false_negatives: int
 
 
+class E2EToleranceResult(TypedDict):
+    tolerance: int
+    total_fp: int
+    total_tp: int
+    total_fn: int
+
+
 class E2ERunnerResult(TypedDict):
     detector_name: str
     dataset_name: str
@@ -29,6 +37,8 @@ class E2ERunnerResult(TypedDict):
     total_fp: int
     total_tp: int
     total_fn: int
+    # Totals for other tolerances than the one the runner matched with, if any were asked for
+    tolerance_results: list[E2EToleranceResult]
 
 
 def result2score(result: E2ERunnerResult) -> float:
@@ -63,26 +73,42 @@ def result2recall(result: E2ERunnerResult) -> float:
     return result['total_tp'] / total_expected
 
 
+
+# Matches detections to expected impacts at most tolerance samples away from them.
+# Detections are matched in order and a detection uses up every expected impact in its range,
+# so double detections of one impact don't both count as true positives.
+# Returns the true positive, false positive and false negative positions.
+def match_detections(expected: list[int], got: list[int], tolerance: int) -> (list[int], list[int], list[int]):
+    remaining = sorted(expected)
+    tp_pos: list[int] = []
+    fp_pos: list[int] = []
+    for d in got:
+        lo = bisect.bisect_left(remaining, d - tolerance)
+        hi = bisect.bisect_right(remaining, d + tolerance)
+        if lo < hi:
+            tp_pos.append(d)
+            del remaining[lo:hi]
+        else:
+            fp_pos.append(d)
+    # Anything left has no detection in range, or it would have been used up
+    return tp_pos, fp_pos, remaining
+
+
+# Totals for every tolerance from the detections that are already in the result, so checking how
+# sensitive a detector is to the tolerance doesn't need the detector to run again
+def result2tolerance_curve(result: E2ERunnerResult, tolerances: list[int]) -> list[E2EToleranceResult]:
+    curve = [E2EToleranceResult(tolerance=t, total_fp=0, total_tp=0, total_fn=0) for t in tolerances]
+    for r in result['record_results']:
+        for point in curve:
+            tp_pos, fp_pos, fn_pos = match_detections(r['expected'], r['got'], point['tolerance'])
+            point['total_tp'] += len(tp_pos)
+            point['total_fp'] += len(fp_pos)
+            point['total_fn'] += len(fn_pos)
+    return curve
+
+
 def load_raw_dataset(dataset: str) -> list[DetectionDataRecord]:
-    ret: list[DetectionDataRecord] = []
-    path_to = f"./e2e_dataset/{dataset}/"
-    bin_files = [x.split('/')[-1] for x in glob.glob(f"{path_to}*.bin")]
-    cal_files = [x.split('/')[-1] for x in glob.glob(f"{path_to}*.cal")]
-    for bix, b in enumerate(bin_files):
-        common_part = b[0:-4]
-        matching_cal_name = f"{common_part}_CD.cal"
-        matching_pck_name = f"{common_part}.pck"
-        for idx, c in enumerate(cal_files):
-            if c == matching_cal_name:
-                ret.append({
-                    "data_path": f"{path_to}{b}",
-                    "calibration_path": f"{path_to}{c}",
-                    "detection_path": f"{path_to}{matching_pck_name}"
-                })
-                bin_files[bix] = "USED UP NAME"
-                cal_files[idx] = "USED UP NAME"
-                break
-    return ret
+    return default_recording_catalog.records(f"./e2e_dataset/{dataset}/")
 
 
 def get_samples(filename) -> list[WristSample]:
@@ -95,15 +121,60 @@ def get_calibration(filename) -> CalibrationData:
         return sr.calparse(file.read())
 
 
-def load_data(data_path: str, cal_path: str):
+def parse_data(data_path: str, cal_path: str) -> SampleBlock:
     samples = get_samples(data_path)
     calibration = get_calibration(cal_path)
     sr.apply_calibration(samples, calibration)
-    return samples
+    return SampleBlock.from_wrist_samples(samples)
+
+
+# The returned block is shared with other loads of the same recording and must not be modified
+def load_data(data_path: str, cal_path: str,
+              cache: RecordingCache | None = default_recording_cache) -> SampleBlock:
+    if cache is None:
+        return parse_data(data_path, cal_path)
+    return cache.load(data_path, cal_path, parse_data)
+
+
+# Reads a calibrated recording a block or a range at a time instead of all at once.
+# The recording is parsed into the recording cache the first time, after that it is read memory mapped,
+# so only the parts that are being used are in memory. Without a cache it is parsed and kept in memory.
+# Nothing is opened until the first read.
+class RecordingReader:
+    def __init__(self, data_path: str, cal_path: str,
+                 cache: RecordingCache | None = default_recording_cache):
+        self.data_path = data_path
+        self.calibration_path = cal_path
+        self.cache = cache
+        self._samples: SampleBlock | None = None
+
+    @property
+    def samples(self) -> SampleBlock:
+        if self._samples is None:
+            if self.cache is None:
+                self._samples = parse_data(self.data_path, self.calibration_path)
+            else:
+                self._samples = self.cache.open(self.data_path, self.calibration_path, parse_data)
+        return self._samples
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    # Samples start to stop, clipped to the recording
+    def read(self, start: int, stop: int) -> SampleBlock:
+        return self.samples[max(start, 0):min(stop, len(self))]
+
+    def blocks(self, block_size: int = default_block_size, start: int = 0,
+               stop: int | None = None) -> Iterator[SampleBlock]:
+        if stop is None or stop > len(self):
+            stop = len(self)
+        for block_start in range(start, stop, block_size):
+            yield self.read(block_start, min(block_start + block_size, stop))
+
+    def __iter__(self) -> Iterator[WristSample]:
+        for block in self.blocks():
+            yield from block
 
 
 def load_detections(detection_path) -> list[int]:
-    if not os.path.exists(detection_path):
-        return []
-    loaded: E2ESwingMetadata = pickle.load(open(detection_path, 'rb'))
-    return loaded["impact_positions"]
+    return default_recording_catalog.get_labels(detection_path)
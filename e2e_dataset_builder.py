@@ -4,7 +4,6 @@ from typing import TypedDict
 import numpy as np
 from matplotlib import pyplot as plt
 
-import sensor_data_reader as sr
 from matplotlib.figure import Figure
 from matplotlib.axes import Axes
 from matplotlib.lines import Line2D
@@ -12,12 +11,12 @@ from matplotlib.backends.backend_tkagg import (
     FigureCanvasTkAgg, NavigationToolbar2Tk
 )
 
-from e2e import get_samples, get_calibration
+from e2e import load_data
 from e2e_detectors import E2ESwingMetadata
-from sensor_data_types import CalibrationData, DominantHand, WornHand, WristSample
+from sensor_data_types import CalibrationData, DominantHand, WornHand, WristSample, SampleBlock
 from impact_detection import *
 import minigolf as mg
-import glob
+from recording_catalog import default_recording_catalog
 from swing_data_instance import *
 from visualization import plot_samples
 
@@ -58,29 +57,17 @@ class RawDataRecord(TypedDict):
 
 
 records: list[RawDataRecord] = []
-current_samples: list[WristSample] = []
+current_samples: SampleBlock = SampleBlock()
 current_record_idx = 0
 
 
 def _load_unprocessed_list():
     global records, current_record_idx
-    path_to = "./e2e_raw_tomark/"
-    bin_files = [x.split('/')[-1] for x in glob.glob(f"{path_to}*.bin")]
-    cal_files = [x.split('/')[-1] for x in glob.glob(f"{path_to}*.cal")]
-    print(bin_files)
-    print(cal_files)
-    for bix, b in enumerate(bin_files):
-        common_part = b[0:-4]
-        matching_cal_name = f"{common_part}_CD.cal"
-        for idx, c in enumerate(cal_files):
-            if c == matching_cal_name:
-                records.append({
-                    "data_path": f"{path_to}{b}",
-                    "calibration_path": f"{path_to}{c}",
-                })
-                bin_files[bix] = "USED UP NAME"
-                cal_files[idx] = "USED UP NAME"
-                break
+    for r in default_recording_catalog.records("./e2e_raw_tomark/"):
+        records.append({
+            "data_path": r["data_path"],
+            "calibration_path": r["calibration_path"],
+        })
     current_record_idx = 0
 
 
@@ -114,9 +101,7 @@ def _load_current_record():
     file_sv.set(filename)
 
     global current_samples
-    samples = get_samples(records[current_record_idx]["data_path"])
-    calibration = get_calibration(records[current_record_idx]["calibration_path"])
-    sr.apply_calibration(samples, calibration)
+    samples = load_data(records[current_record_idx]["data_path"], records[current_record_idx]["calibration_path"])
     current_samples = samples
     _plot_current_samples()
     _process_minigolf()
@@ -5,7 +5,6 @@ from typing import TypedDict
 import numpy as np
 from matplotlib import pyplot as plt
 
-import sensor_data_reader as sr
 from matplotlib.figure import Figure
 from matplotlib.axes import Axes
 from matplotlib.lines import Line2D
@@ -13,12 +12,12 @@ from matplotlib.backends.backend_tkagg import (
     FigureCanvasTkAgg, NavigationToolbar2Tk
 )
 
-from e2e import get_samples, get_calibration
+from e2e import load_data
 from e2e_detectors import E2ESwingMetadata
-from sensor_data_types import CalibrationData, DominantHand, WornHand, WristSample
+from sensor_data_types import CalibrationData, DominantHand, WornHand, WristSample, SampleBlock
 from impact_detection import *
 import minigolf as mg
-import glob
+from recording_catalog import default_recording_catalog
 from swing_data_instance import *
 from visualization import plot_samples
 
@@ -61,32 +60,14 @@ class RawDataRecord(TypedDict):
 
 
 records: list[RawDataRecord] = []
-current_samples: list[WristSample] = []
+current_samples: SampleBlock = SampleBlock()
 current_detections: list[int] = []
 current_record_idx = 0
 
 
 def _load_unprocessed_list():
     global records, current_record_idx
-    path_to = f"./e2e_dataset/{dataset_kind}/"
-    bin_files = [x.split('/')[-1] for x in glob.glob(f"{path_to}*.bin")]
-    cal_files = [x.split('/')[-1] for x in glob.glob(f"{path_to}*.cal")]
-    print(bin_files)
-    print(cal_files)
-    for bix, b in enumerate(bin_files):
-        common_part = b[0:-4]
-        matching_cal_name = f"{common_part}_CD.cal"
-        matching_pck_name = f"{common_part}.pck"
-        for idx, c in enumerate(cal_files):
-            if c == matching_cal_name:
-                records.append({
-                    "data_path": f"{path_to}{b}",
-                    "calibration_path": f"{path_to}{c}",
-                    "detection_path": f"{path_to}{matching_pck_name}"
-                })
-                bin_files[bix] = "USED UP NAME"
-                cal_files[idx] = "USED UP NAME"
-                break
+    records += default_recording_catalog.records(f"./e2e_dataset/{dataset_kind}/")
     current_record_idx = 0
 
 
@@ -112,10 +93,7 @@ def _previous_record():
 
 
 def _load_detections(detection_path) -> list[int]:
-    if not os.path.exists(detection_path):
-        return []
-    loaded: E2ESwingMetadata = pickle.load(open(detection_path, 'rb'))
-    return loaded["impact_positions"]
+    return default_recording_catalog.get_labels(detection_path)
 
 
 def _update_detections_string():
@@ -135,9 +113,7 @@ def _load_current_record():
     file_sv.set(filename)
 
     global current_samples, current_detections
-    samples = get_samples(records[current_record_idx]["data_path"])
-    calibration = get_calibration(records[current_record_idx]["calibration_path"])
-    sr.apply_calibration(samples, calibration)
+    samples = load_data(records[current_record_idx]["data_path"], records[current_record_idx]["calibration_path"])
     current_samples = samples
     current_detections = _load_detections(records[current_record_idx]['detection_path'])
     _plot_current_samples()
@@ -1,8 +1,12 @@
+import inspect
+import math
+import queue
 import subprocess
+import threading
+import numba
 from launchpad import *
 from sensor_data_types import *
 from minigolf import MinigolfConfig, MinigolfResult, MinigolfDetector
-from collections import deque
 import numpy as np
 
 
@@ -21,6 +25,29 @@ class E2EDetector:
     def add_sample(self, sample: WristSample) -> int | None:
         pass
 
+    # Called after the last sample, returns detections the detector was still holding back
+    def finish(self) -> list[int]:
+        return []
+
+    # Detectors with the same model key use the same trained model, None if there is nothing to train
+    def get_model_key(self) -> str | None:
+        return None
+
+    # Files the detections depend on besides the recording, like the split a model is trained on
+    def get_data_files(self) -> list[str]:
+        return []
+
+    # Settings the detections depend on. Together with the contents of the code and data files, it tells
+    # if detections kept from an earlier run are still the same. Settings that only change when
+    # detections are reported, like batching, are left out.
+    def get_config(self) -> dict:
+        return {"class": type(self).__name__}
+
+    # Source files of the detection code
+    def get_code_files(self) -> list[str]:
+        classes = [c for c in type(self).__mro__ if c is not object] + [SampleRingBuffer]
+        return sorted(set(inspect.getsourcefile(c) for c in classes))
+
 
 def geq_sign_invariant(a, b):
     if b < 0:
@@ -29,68 +56,159 @@ def geq_sign_invariant(a, b):
         return a >= b
 
 
-def detect_threshold(impact_window: list[WristSample],
-                     palm_vibration_threshold: float = 2,
-                     arm_gyro_x_threshold: float | None = 40,
-                     palm_gyro_z_dif_threshold: float | None = None) -> int | None:
-    w_acc_dif_norms = []
-    w_gyro_x_vals = []
-    w_gyro_z_vals = []
-    w_gyro_z_difs = []
-    last_acc = None
-    last_gyro_z = None
-    for i, s in enumerate(impact_window):
-        acc = s['palm_acc']
-
-        if last_acc is None:
-            last_acc = acc
-            last_gyro_z = s['palm_gyro'][2]
-
-        acc_dif_norm = np.linalg.norm([acc[0] - last_acc[0], acc[1] - last_acc[1], acc[2] - last_acc[2]])
-        gyro_z_dif = s['palm_gyro'][2] - last_gyro_z
-        gyro_x = s['arm_gyro'][0]
-        gyro_z = s['palm_gyro'][2]
-        last_acc = s['palm_acc']
-        last_gyro_z = gyro_z
-        w_acc_dif_norms.append(acc_dif_norm)
-        w_gyro_x_vals.append(gyro_x)
-        w_gyro_z_vals.append(gyro_z)
-        w_gyro_z_difs.append(gyro_z_dif)
-
-    current_peak_idx = None
-    current_peak_value = -9999999
+def detect_threshold_features(acc_dif_norms: np.ndarray,
+                              gyro_x_vals: np.ndarray,
+                              gyro_z_difs: np.ndarray,
+                              palm_vibration_threshold: float = 2,
+                              arm_gyro_x_threshold: float | None = 40,
+                              palm_gyro_z_dif_threshold: float | None = None) -> int | None:
+    # Works on per-sample features of the window, returns index of the peak in the window
+    valid = acc_dif_norms >= palm_vibration_threshold
+    if arm_gyro_x_threshold is not None:
+        valid &= gyro_x_vals >= arm_gyro_x_threshold
+    if palm_gyro_z_dif_threshold is not None:
+        valid &= geq_sign_invariant(gyro_z_difs, palm_gyro_z_dif_threshold)
+
+    # Most windows contain no candidates at all, so only score the ones that passed the thresholds
+    candidates = valid.nonzero()[0]
+    if len(candidates) == 0:
+        return None
+
     if palm_gyro_z_dif_threshold is None:
         # Use basic impact detection based on acceleration peak
-        for i in range(len(w_acc_dif_norms)):
-            if (w_acc_dif_norms[i] >= palm_vibration_threshold) \
-                    and (True if arm_gyro_x_threshold is None else w_gyro_x_vals[i] >= arm_gyro_x_threshold):
-                if w_acc_dif_norms[i] > current_peak_value:
-                    current_peak_value = w_acc_dif_norms[i]
-                    current_peak_idx = i
+        scores = acc_dif_norms[candidates]
     else:
         # Use impact detection based on combined score
-        for i in range(len(w_acc_dif_norms)):
-            if (w_acc_dif_norms[i] >= palm_vibration_threshold) \
-                    and (True if arm_gyro_x_threshold is None else w_gyro_x_vals[i] >= arm_gyro_x_threshold)\
-                    and geq_sign_invariant(w_gyro_z_difs[i], palm_gyro_z_dif_threshold):
-                # print(f"Ac dif: {w_acc_dif_norms[i]}, gZ dif: {w_gyro_z_difs[i]}")
-                acc_weight = 20
-                gyro_x_weight = 0
-                gyro_z_weight = -1
-                score = w_acc_dif_norms[i] * acc_weight + w_gyro_x_vals[i] * gyro_x_weight + w_gyro_z_difs[
-                    i] * gyro_z_weight
-                if score > current_peak_value:
-                    # print(f"New peak score: {score} @ {i}")
-                    # print(f"+ Acc dif\t: {w_acc_dif_norms[i] * acc_weight}")
-                    # print(f"+ Gyro X\t: {w_gyro_x_vals[i] * gyro_x_weight}")
-                    # print(f"+ gZ dif\t: {w_gyro_z_difs[i] * gyro_z_weight}")
-                    current_peak_value = score
-                    current_peak_idx = i
-
-    if current_peak_idx is None:
+        acc_weight = 20
+        gyro_x_weight = 0
+        gyro_z_weight = -1
+        scores = acc_dif_norms[candidates] * acc_weight + gyro_x_vals[candidates] * gyro_x_weight \
+            + gyro_z_difs[candidates] * gyro_z_weight
+
+    # argmax returns the first of equal peaks, same as a sample by sample scan with strict > does
+    peak = int(scores.argmax())
+    if not scores[peak] > -9999999:
+        # Only with scores the scan never takes, like NaN, which argmax would return
+        scores = np.where(scores > -9999999, scores, -np.inf)
+        peak = int(scores.argmax())
+        if scores[peak] == -np.inf:
+            return None
+    return int(candidates[peak])
+
+
+# Columns of the (N x 12) window the scan reads, as plain ints for the compiled code
+_ARM_GYRO_X = ARM_GYRO.start
+_PALM_GYRO_Z = PALM_GYRO.start + 2
+_PALM_ACC_X = PALM_ACC.start
+
+
+# Sample by sample scan over the (N x 12) window, compiled, since on windows this short the per-call
+# overhead of a dozen numpy operations outweighs the work itself. Returns the index of the peak, -1 for none.
+@numba.njit(cache=True)
+def _detect_threshold_scan(window: np.ndarray,
+                           palm_vibration_threshold: float,
+                           arm_gyro_x_threshold: float | None,
+                           palm_gyro_z_dif_threshold: float | None) -> int:
+    peak_idx = -1
+    peak_value = -9999999.0
+    for i in range(window.shape[0]):
+        # The first sample is compared to itself, so its differences are 0
+        last = i - 1 if i > 0 else 0
+        acc_dif_x = window[i, _PALM_ACC_X] - window[last, _PALM_ACC_X]
+        acc_dif_y = window[i, _PALM_ACC_X + 1] - window[last, _PALM_ACC_X + 1]
+        acc_dif_z = window[i, _PALM_ACC_X + 2] - window[last, _PALM_ACC_X + 2]
+        acc_dif_norm = math.sqrt(acc_dif_x * acc_dif_x + acc_dif_y * acc_dif_y + acc_dif_z * acc_dif_z)
+        gyro_x_val = window[i, _ARM_GYRO_X]
+        gyro_z_dif = window[i, _PALM_GYRO_Z] - window[last, _PALM_GYRO_Z]
+
+        if not acc_dif_norm >= palm_vibration_threshold:
+            continue
+        if arm_gyro_x_threshold is not None and not gyro_x_val >= arm_gyro_x_threshold:
+            continue
+        if palm_gyro_z_dif_threshold is None:
+            # Use basic impact detection based on acceleration peak
+            score = acc_dif_norm
+        else:
+            # Use impact detection based on combined score, with the sign invariant threshold
+            if palm_gyro_z_dif_threshold < 0:
+                passed = gyro_z_dif <= palm_gyro_z_dif_threshold
+            else:
+                passed = gyro_z_dif >= palm_gyro_z_dif_threshold
+            if not passed:
+                continue
+            acc_weight = 20
+            gyro_x_weight = 0
+            gyro_z_weight = -1
+            score = acc_dif_norm * acc_weight + gyro_x_val * gyro_x_weight + gyro_z_dif * gyro_z_weight
+        if score > peak_value:
+            peak_value = score
+            peak_idx = i
+    return peak_idx
+
+
+def detect_threshold(impact_window: np.ndarray | SampleBlock | list[WristSample],
+                     palm_vibration_threshold: float = 2,
+                     arm_gyro_x_threshold: float | None = 40,
+                     palm_gyro_z_dif_threshold: float | None = None) -> int | None:
+    if isinstance(impact_window, np.ndarray):
+        window = impact_window
+    else:
+        window = wristSample2sampleBlock(impact_window).data
+    # Thresholds are passed as floats, so ints and floats share one compiled scan
+    peak_idx = _detect_threshold_scan(window, float(palm_vibration_threshold),
+                                      None if arm_gyro_x_threshold is None else float(arm_gyro_x_threshold),
+                                      None if palm_gyro_z_dif_threshold is None else float(palm_gyro_z_dif_threshold))
+    if peak_idx < 0:
         return None
-    # print(f"Window evaluated with peak @ {current_peak_idx}")
-    return len(impact_window) - current_peak_idx
+    return len(window) - peak_idx
+
+
+class ThresholdFeatureRing:
+    # Keeps the per-sample features used by detect_threshold_features for the last `size` samples,
+    # so evaluating a window doesn't need to recompute anything
+    def __init__(self, size: int):
+        self.size = size
+        self.acc_dif_norms = np.zeros(size)
+        self.gyro_x_vals = np.zeros(size)
+        self.gyro_z_difs = np.zeros(size)
+        self.next_idx = 0
+        self.count = 0
+        self.last_acc = None
+        self.last_gyro_z = None
+
+    def add_sample(self, sample: WristSample):
+        acc = sample['palm_acc']
+        gyro_z = sample['palm_gyro'][2]
+        if self.last_acc is None:
+            self.last_acc = acc
+            self.last_gyro_z = gyro_z
+
+        dx = acc[0] - self.last_acc[0]
+        dy = acc[1] - self.last_acc[1]
+        dz = acc[2] - self.last_acc[2]
+        self.acc_dif_norms[self.next_idx] = math.sqrt(dx * dx + dy * dy + dz * dz)
+        self.gyro_x_vals[self.next_idx] = sample['arm_gyro'][0]
+        self.gyro_z_difs[self.next_idx] = gyro_z - self.last_gyro_z
+        self.last_acc = acc
+        self.last_gyro_z = gyro_z
+
+        self.next_idx = (self.next_idx + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+
+    def is_full(self) -> bool:
+        return self.count >= self.size
+
+    def get_window(self) -> (np.ndarray, np.ndarray, np.ndarray,):
+        # Oldest sample first. Like in detect_threshold, differences of the first sample
+        # in the window are taken against itself
+        i = self.next_idx
+        acc_dif_norms = np.concatenate((self.acc_dif_norms[i:], self.acc_dif_norms[:i]))
+        gyro_x_vals = np.concatenate((self.gyro_x_vals[i:], self.gyro_x_vals[:i]))
+        gyro_z_difs = np.concatenate((self.gyro_z_difs[i:], self.gyro_z_difs[:i]))
+        acc_dif_norms[0] = 0
+        gyro_z_difs[0] = 0
+        return acc_dif_norms, gyro_x_vals, gyro_z_difs
 
 
 class E2EThreshold(E2EDetector):
@@ -102,7 +220,7 @@ class E2EThreshold(E2EDetector):
                  arm_gyro_x_threshold: float | None = 40,
                  palm_gyro_z_dif_threshold: float | None = None):
         self.name = name
-        self.buffer = deque([])
+        self.features = ThresholdFeatureRing(window_size)
         self.sample_count = 0
         self.window_size = window_size
         self.window_period = (self.window_size // 4) * 3
@@ -117,6 +235,14 @@ class E2EThreshold(E2EDetector):
     def get_name(self) -> str:
         return self.name
 
+    def get_config(self) -> dict:
+        return {**super().get_config(),
+                "window_size": self.window_size,
+                "cooldown_period": self.cooldown_period,
+                "palm_vibration_threshold": self.palm_vibration_threshold,
+                "arm_gyro_x_threshold": self.arm_gyro_x_threshold,
+                "palm_gyro_z_dif_threshold": self.palm_gyro_z_dif_threshold}
+
     def iterate_impact(self) -> int | None:
         # Returns if this window contained an impact and if so, how many samples back was it
         self.next_window -= 1
@@ -126,22 +252,24 @@ class E2EThreshold(E2EDetector):
             return None
         if self.next_window <= 0:
             self.next_window = self.window_period
-            if len(self.buffer) < self.window_size:
+            if not self.features.is_full():
                 return None
             else:
-                return detect_threshold(
-                    list(self.buffer)[(len(self.buffer) - self.window_size):],
+                acc_dif_norms, gyro_x_vals, gyro_z_difs = self.features.get_window()
+                peak_idx = detect_threshold_features(
+                    acc_dif_norms, gyro_x_vals, gyro_z_difs,
                     palm_vibration_threshold=self.palm_vibration_threshold,
                     arm_gyro_x_threshold=self.arm_gyro_x_threshold,
                     palm_gyro_z_dif_threshold=self.palm_gyro_z_dif_threshold
                 )
+                if peak_idx is None:
+                    return None
+                return self.window_size - peak_idx
         else:
             return None
 
     def add_sample(self, sample: WristSample) -> int | None:
-        self.buffer.append(sample)
-        if len(self.buffer) > (self.window_size * 2):
-            self.buffer.popleft()
+        self.features.add_sample(sample)
         imp_result = self.iterate_impact()
         if imp_result is not None:
             self.cooldown_timer = self.cooldown_period
@@ -150,53 +278,181 @@ class E2EThreshold(E2EDetector):
             return None
 
 
+# Reads the state minigolf gave after sample number sample_count, returns the detection if there was one
+def read_minigolf_state(mgp: subprocess.Popen, sample_count: int) -> int | None:
+    current_state = mgp.stdout.readline()
+    if current_state == "":
+        raise EOFError(f"Minigolf exited before answering sample {sample_count}")
+    s = list(map(lambda x: int(x), current_state.split()))
+    if s[0] == 5:
+        # Swing detected
+        return sample_count - s[3]  # Length of followthrough
+    return None
+
+
+# Reader thread of E2EMinigolf's offline mode. It doesn't hold the detector, so dropping the detector
+# still terminates minigolf, which ends this thread too.
+def read_minigolf_states(mgp: subprocess.Popen, written: queue.Queue, detections: list[int], errors: list[Exception]):
+    answered = 0
+    try:
+        while True:
+            count = written.get()
+            if count is None:
+                return
+            for _ in range(count):
+                answered += 1
+                result = read_minigolf_state(mgp, answered)
+                if result is not None:
+                    detections.append(result)
+    except Exception as e:
+        errors.append(e)
+        # Otherwise minigolf could block on a full pipe, and the writer with it
+        mgp.terminate()
+
+
 class E2EMinigolf(E2EDetector):
+    # With lookahead, samples are sent to minigolf without waiting for its state after each one, so
+    # detections are reported up to lookahead samples later. With lookahead None, the whole recording is
+    # streamed to minigolf batch_size samples at a time while a thread reads the states, and every
+    # detection is returned by finish().
+    # Lookahead is kept below what fits in the pipe from minigolf, so neither side blocks the other.
+    # Minigolf is only started by the first sample, so building the detector has no side effects.
+    max_lookahead = 1024
+
     def __init__(self,
                  dominantHand: DominantHand,
                  wornHand: WornHand,
                  detector: MinigolfDetector,
-                 name: str = "Minigolf"):
+                 name: str = "Minigolf",
+                 lookahead: int | None = 0,
+                 batch_size: int = 1024):
+        self.mgp: subprocess.Popen | None = None
+        self.reader: threading.Thread | None = None
+        if lookahead is not None and lookahead > self.max_lookahead:
+            raise ValueError(f"Minigolf lookahead can be at most {self.max_lookahead}")
         self.name = name
+        self.dominantHand = dominantHand
+        self.wornHand = wornHand
+        self.detector = detector
         self.sample_count = 0
+        self.lookahead = lookahead
+        self.batch_size = batch_size
+        # Samples minigolf hasn't given a state for yet
+        self.unanswered = 0
+
+    def start(self):
         self.mgp = subprocess.Popen("./minigolf",
                                     stdin=subprocess.PIPE,
                                     stdout=subprocess.PIPE,
                                     text=True,
                                     bufsize=1)
 
-        config_line = f"{dominantHand.value} {wornHand.value} {detector.value}\n"
+        config_line = f"{self.dominantHand.value} {self.wornHand.value} {self.detector.value}\n"
         self.mgp.stdin.write(config_line)
 
+        if self.lookahead is None:
+            self.batch: list[str] = []
+            self.detections: list[int] = []
+            self.errors: list[Exception] = []
+            # Sizes of the batches written, None once all are
+            self.written: queue.Queue[int | None] = queue.Queue()
+            self.reader = threading.Thread(target=read_minigolf_states,
+                                           args=(self.mgp, self.written, self.detections, self.errors),
+                                           daemon=True)
+            self.reader.start()
+
+    def close(self):
+        if self.mgp is not None:
+            self.mgp.terminate()
+        if self.reader is not None:
+            # Lets the reader thread end if it is waiting for the next batch
+            self.written.put(None)
+
     def __del__(self):
-        self.mgp.terminate()
+        self.close()
 
     def get_name(self) -> str:
         return self.name
 
+    def get_data_files(self) -> list[str]:
+        return ["./minigolf"]
+
+    def get_config(self) -> dict:
+        return {**super().get_config(),
+                "dominantHand": self.dominantHand,
+                "wornHand": self.wornHand,
+                "detector": self.detector}
+
+    def read_oldest_state(self) -> int | None:
+        result = read_minigolf_state(self.mgp, self.sample_count - self.unanswered + 1)
+        self.unanswered -= 1
+        return result
+
+    # Waits for the reader thread and raises what it failed with, if anything
+    def join_reader(self):
+        self.written.put(None)
+        self.reader.join()
+        if len(self.errors) > 0:
+            raise self.errors[0]
+
+    def write_batch(self):
+        try:
+            self.mgp.stdin.write("".join(self.batch))
+        except BrokenPipeError:
+            # Minigolf exited, the reader knows why
+            self.join_reader()
+            raise
+        self.written.put(len(self.batch))
+        self.batch = []
+
     def add_sample(self, sample: WristSample) -> int | None:
+        if self.mgp is None:
+            self.start()
         sample_line = "{:.5f} {:.5f} {:.5f} {:.5f} {:.5f} {:.5f} {:.5f} {:.5f} {:.5f} {:.5f} {:.5f} {:.5f}\n".format(
             sample["arm_acc"][0], sample["arm_acc"][1], sample["arm_acc"][2],
             sample["arm_gyro"][0], sample["arm_gyro"][1], sample["arm_gyro"][2],
             sample["palm_acc"][0], sample["palm_acc"][1], sample["palm_acc"][2],
             sample["palm_gyro"][0], sample["palm_gyro"][1], sample["palm_gyro"][2]
         )
-        self.mgp.stdin.write(sample_line)
         self.sample_count += 1
 
-        current_state = self.mgp.stdout.readline()
-        s = list(map(lambda x: int(x), current_state.split()))
-        if s[0] == 5:
-            # Swing detected
-            return self.sample_count - s[3]  # Length of followthrough
+        if self.lookahead is None:
+            self.batch.append(sample_line)
+            if len(self.batch) >= self.batch_size:
+                self.write_batch()
+            return None
+
+        self.mgp.stdin.write(sample_line)
+        self.unanswered += 1
+        if self.unanswered > self.lookahead:
+            return self.read_oldest_state()
         return None
 
+    def finish(self) -> list[int]:
+        if self.mgp is None:
+            return []
+
+        if self.lookahead is None:
+            if len(self.batch) > 0:
+                self.write_batch()
+            self.join_reader()
+            return self.detections
+
+        found = []
+        while self.unanswered > 0:
+            result = self.read_oldest_state()
+            if result is not None:
+                found.append(result)
+        return found
+
 
 class E2EBaseRocket(E2EDetector):
     def get_classifier(self) -> LaunchpadClassifier:
         pass
 
-    def get_samples_for_rocket(self) -> list[WristSample]:
-        return list(self.buffer)
+    # lag is how many samples back the window should end, used when re-running past samples
+    def get_samples_for_rocket(self, lag: int = 0) -> SampleBlock:
+        return self.buffer.window(lag=lag)
 
     def __init__(self,
                  name: str = "BaseRocket",
@@ -204,9 +460,10 @@ class E2EBaseRocket(E2EDetector):
                  cooldown_period: int = 50,
                  palm_vibration_threshold: float = 2,
                  arm_gyro_x_threshold: float | None = 40,
-                 palm_gyro_z_dif_threshold: float | None = None):
+                 palm_gyro_z_dif_threshold: float | None = None,
+                 batch_budget: int = 0):
         self.name = name
-        self.buffer = deque([])
+        self.buffer = SampleRingBuffer(300, history=batch_budget)
         self.window_size = window_size
         self.window_period = (self.window_size // 4) * 3
         self.next_window = self.window_period
@@ -217,11 +474,42 @@ class E2EBaseRocket(E2EDetector):
         self.palm_vibration_threshold = palm_vibration_threshold
         self.arm_gyro_x_threshold = arm_gyro_x_threshold
         self.palm_gyro_z_dif_threshold = palm_gyro_z_dif_threshold
+        # With a batch budget, windows due for classification are assumed to not be swings and classified
+        # together once the oldest has waited batch_budget samples. If one of them turns out to be a swing,
+        # the samples from it onwards are run again with the real results, so detections are the same
+        # as when classifying one by one, only reported up to batch_budget samples later.
+        self.batch_budget = batch_budget
+        self.pending_due: list[int] = []
+        self.checkpoints: dict[int, tuple] = {}
+        self.known_results: dict[int, bool] = {}
+        self.replaying = False
+        self.detections: list[int] = []
 
     def get_name(self) -> str:
         return self.name
 
-    def iterate_impact(self) -> int | None:
+    def get_config(self) -> dict:
+        return {**super().get_config(),
+                "window_size": self.window_size,
+                "cooldown_period": self.cooldown_period,
+                "palm_vibration_threshold": self.palm_vibration_threshold,
+                "arm_gyro_x_threshold": self.arm_gyro_x_threshold,
+                "palm_gyro_z_dif_threshold": self.palm_gyro_z_dif_threshold,
+                "model": self.get_model_key()}
+
+    # The classifier's code too
+    def get_code_files(self) -> list[str]:
+        return sorted(set(super().get_code_files() + [inspect.getsourcefile(LaunchpadClassifier),
+                                                      inspect.getsourcefile(DimensionSynth)]))
+
+    def get_state(self) -> tuple:
+        return self.next_window, self.sample_count, self.cooldown_timer, list(self.active_followthroughs)
+
+    def set_state(self, state: tuple):
+        self.next_window, self.sample_count, self.cooldown_timer, followthroughs = state
+        self.active_followthroughs = list(followthroughs)
+
+    def iterate_impact(self, lag: int = 0) -> int | None:
         # Returns if this window contained an impact and if so, how many samples back was it
         self.next_window -= 1
         self.sample_count += 1
@@ -230,11 +518,12 @@ class E2EBaseRocket(E2EDetector):
             return None
         if self.next_window <= 0:
             self.next_window = self.window_period
-            if len(self.buffer) < self.window_size:
+            buffered = self.buffer.length(lag)
+            if buffered < self.window_size:
                 return None
             else:
                 return detect_threshold(
-                    list(self.buffer)[(len(self.buffer) - self.window_size):],
+                    self.buffer.window(slice(buffered - self.window_size, None), lag).data,
                     palm_vibration_threshold=self.palm_vibration_threshold,
                     arm_gyro_x_threshold=self.arm_gyro_x_threshold,
                     palm_gyro_z_dif_threshold=self.palm_gyro_z_dif_threshold
@@ -242,23 +531,30 @@ class E2EBaseRocket(E2EDetector):
         else:
             return None
 
-    def add_sample(self, sample: WristSample) -> int | None:
-        self.buffer.append(sample)
-        if len(self.buffer) > 300:
-            self.buffer.popleft()
-        imp_result = self.iterate_impact()
+    def classify_due(self, lag: int) -> bool:
+        # All followthroughs due on the same sample see the same window, so classify it once
+        if self.sample_count in self.known_results:
+            return self.known_results[self.sample_count]
+        if self.batch_budget > 0 and not self.replaying:
+            self.pending_due.append(self.sample_count)
+            return False
+        result = self.get_classifier().is_swing(self.get_samples_for_rocket(lag))
+        self.known_results[self.sample_count] = result
+        return result
+
+    def step(self, lag: int = 0):
+        imp_result = self.iterate_impact(lag)
 
-        return_result = None
         ft_to_remove = []
         for idx, ft in enumerate(self.active_followthroughs):
             self.active_followthroughs[idx] -= 1
             if ft <= 0:
                 ft_to_remove.append(idx)
                 # Run ROCKET for final validation
-                # Impact should be 100 samples before
-                if self.get_classifier().is_swing(self.get_samples_for_rocket()):
+                if self.classify_due(lag):
                     if self.cooldown_timer <= 0:
-                        return_result = self.sample_count - 100
+                        # Impact should be 100 samples before
+                        self.detections.append(self.sample_count - 100)
                     self.cooldown_timer = self.cooldown_period
 
         ft_to_remove.sort(reverse=True)
@@ -268,53 +564,131 @@ class E2EBaseRocket(E2EDetector):
         if imp_result is not None:
             self.active_followthroughs.append(100 - imp_result)
 
-        return return_result
+    def classify_pending(self):
+        current_sample = self.sample_count
+        windows = [self.get_samples_for_rocket(current_sample - d) for d in self.pending_due]
+        results = self.get_classifier().is_swing_batch(windows)
+        for d, r in zip(self.pending_due, results):
+            self.known_results[d] = r
+        swings = [d for d, r in zip(self.pending_due, results) if r]
+
+        if len(swings) > 0:
+            # Everything after the first swing assumed it wasn't one, so go back and run it again
+            self.set_state(self.checkpoints[swings[0]])
+            self.replaying = True
+            for lag in range(current_sample - swings[0], -1, -1):
+                self.step(lag)
+            self.replaying = False
+
+        self.pending_due.clear()
+        self.checkpoints.clear()
+        self.known_results.clear()
+
+    def add_sample(self, sample: WristSample) -> int | None:
+        self.buffer.append(sample)
+        if self.batch_budget > 0:
+            state = self.get_state()
+            pending_count = len(self.pending_due)
+            self.step()
+            if len(self.pending_due) > pending_count:
+                self.checkpoints[self.sample_count] = state
+            if len(self.pending_due) > 0 and self.sample_count - self.pending_due[0] >= self.batch_budget:
+                self.classify_pending()
+        else:
+            self.step()
+            self.known_results.clear()
+
+        if len(self.detections) > 0:
+            return self.detections.pop(0)
+        return None
+
+    def finish(self) -> list[int]:
+        if len(self.pending_due) > 0:
+            self.classify_pending()
+        remaining = self.detections
+        self.detections = []
+        return remaining
 
 
 class E2ERocketAlpha(E2EBaseRocket):
     classifier: LaunchpadClassifier | None = None
 
     def get_classifier(self) -> LaunchpadClassifier:
+        # Trained on first use, so detectors can be built cheaply to find out their name and keys
+        if E2ERocketAlpha.classifier is None:
+            E2ERocketAlpha.classifier = RocketPuttingRidge(self.split)
         return E2ERocketAlpha.classifier
 
+    def get_model_key(self) -> str | None:
+        return f"E2ERocketAlpha+{self.split}"
+
+    def get_data_files(self) -> list[str]:
+        return [self.split]
+
     def __init__(self):
         super().__init__(name="RocketAlpha")
-        if E2ERocketAlpha.classifier is None:
-            E2ERocketAlpha.classifier = RocketPuttingRidge("split_0.100_20220502_new_putts.pck")
+        self.split = "split_0.100_20220502_new_putts.pck"
 
 
 class E2ERocketBeta(E2EBaseRocket):
     classifier: LaunchpadClassifier | None = None
 
     def get_classifier(self) -> LaunchpadClassifier:
+        # Trained on first use, so detectors can be built cheaply to find out their name and keys
+        if E2ERocketBeta.classifier is None:
+            E2ERocketBeta.classifier = RocketPuttingRidge(
+                self.split,
+                crop=self.bufslice,
+                dimensions_to_remove=self.dimensions_to_remove,
+                synthesize_dimensions=self.synthesize_dimensions
+            )
         return E2ERocketBeta.classifier
 
-    def get_samples_for_rocket(self) -> list[WristSample]:
-        return list(self.buffer)[self.bufslice]
+    def get_model_key(self) -> str | None:
+        synth_names = [d.get_name() for d in self.synthesize_dimensions]
+        return f"E2ERocketBeta+{self.split}+{self.bufslice}+{self.dimensions_to_remove}+{synth_names}"
+
+    def get_data_files(self) -> list[str]:
+        return [self.split]
+
+    def get_samples_for_rocket(self, lag: int = 0) -> SampleBlock:
+        return self.buffer.window(self.bufslice, lag)
 
     def __init__(self):
         super().__init__(name="RocketBeta")
+        self.split = "split_0.100_20220502_new_putts.pck"
         self.bufslice = slice(150, 250)
-        if E2ERocketBeta.classifier is None:
-            E2ERocketBeta.classifier = RocketPuttingRidge(
-                "split_0.100_20220502_new_putts.pck",
-                crop=self.bufslice,
-                dimensions_to_remove=["arm_acc_x", "arm_acc_y", "arm_acc_z",
-                                      "palm_acc_x", "palm_acc_y", "palm_acc_z",
-                                      "palm_gyro_y", "palm_gyro_z",
-                                      "arm_gyro_y", "palm_gyro_z"],
-                synthesize_dimensions=[PalmAccDifSynth(), ArmGyroNormSynth(), PalmGyroNormSynth()]
-            )
+        self.dimensions_to_remove = ["arm_acc_x", "arm_acc_y", "arm_acc_z",
+                                     "palm_acc_x", "palm_acc_y", "palm_acc_z",
+                                     "palm_gyro_y", "palm_gyro_z",
+                                     "arm_gyro_y", "palm_gyro_z"]
+        self.synthesize_dimensions = [PalmAccDifSynth(), ArmGyroNormSynth(), PalmGyroNormSynth()]
 
 
 class E2ERocketPuttingPrime(E2EBaseRocket):
     classifier_dict: dict[str, LaunchpadClassifier] = {}
 
     def get_classifier(self) -> LaunchpadClassifier:
-        return E2ERocketPuttingPrime.classifier_dict[f"{self.name}+{self.split}"]
+        # Trained on first use, so detectors can be built cheaply to find out their model key
+        key = self.get_model_key()
+        if key not in E2ERocketPuttingPrime.classifier_dict:
+            E2ERocketPuttingPrime.classifier_dict[key] = RocketPuttingRidge(
+                self.split,
+                crop=self.crop,
+                dimensions_to_remove=self.dimensions_to_remove,
+                synthesize_dimensions=self.synthesize_dimensions
+            )
+        return E2ERocketPuttingPrime.classifier_dict[key]
+
+    def get_model_key(self) -> str | None:
+        synth_names = [d.get_name() for d in self.synthesize_dimensions]
+        return f"E2ERocketPuttingPrime+{self.split}+{self.crop}+{self.dimensions_to_remove}+{synth_names}"
+
+    def get_data_files(self) -> list[str]:
+        return [self.split]
 
-    def get_samples_for_rocket(self) -> list[WristSample]:
-        return list(self.buffer)[self.crop]
+    def get_samples_for_rocket(self, lag: int = 0) -> SampleBlock:
+        return self.buffer.window(self.crop, lag)
 
     def __init__(self,
                  name: str,
@@ -322,33 +696,44 @@ class E2ERocketPuttingPrime(E2EBaseRocket):
                  crop: slice = slice(0, 300),
                  dimensions_to_remove: list[str] = [],
                  synthesize_dimensions: list[DimensionSynth] = [],
-                 window_size: int = 50):
+                 window_size: int = 50,
+                 batch_budget: int = 0):
         super().__init__(name=name,
                          arm_gyro_x_threshold=23,
                          palm_vibration_threshold=1.75,
                          window_size=window_size,
-                         cooldown_period=50)
+                         cooldown_period=50,
+                         batch_budget=batch_budget)
         self.crop = crop
         self.split = split
         self.dimensions_to_remove = dimensions_to_remove
         self.synthesize_dimensions = synthesize_dimensions
-        if f"{self.name}+{self.split}" not in E2ERocketPuttingPrime.classifier_dict:
-            E2ERocketPuttingPrime.classifier_dict[f"{self.name}+{self.split}"] = RocketPuttingRidge(
-                split,
-                crop=self.crop,
-                dimensions_to_remove=dimensions_to_remove,
-                synthesize_dimensions=synthesize_dimensions
-            )
 
 
 class E2ERocketPuttingIsolation(E2EBaseRocket):
     classifier_dict: dict[str, LaunchpadClassifier] = {}
 
     def get_classifier(self) -> LaunchpadClassifier:
-        return E2ERocketPuttingIsolation.classifier_dict[f"{self.name}+{self.split}"]
+        # Trained on first use, so detectors can be built cheaply to find out their model key
+        key = self.get_model_key()
+        if key not in E2ERocketPuttingIsolation.classifier_dict:
+            E2ERocketPuttingIsolation.classifier_dict[key] = RocketPuttingIsolation(
+                self.split,
+                crop=self.crop,
+                dimensions_to_remove=self.dimensions_to_remove,
+                synthesize_dimensions=self.synthesize_dimensions
+            )
+        return E2ERocketPuttingIsolation.classifier_dict[key]
+
+    def get_model_key(self) -> str | None:
+        synth_names = [d.get_name() for d in self.synthesize_dimensions]
+        return f"E2ERocketPuttingIsolation+{self.split}+{self.crop}+{self.dimensions_to_remove}+{synth_names}"
 
-    def get_samples_for_rocket(self) -> list[WristSample]:
-        return list(self.buffer)[self.crop]
+    def get_data_files(self) -> list[str]:
+        return [self.split]
+
+    def get_samples_for_rocket(self, lag: int = 0) -> SampleBlock:
+        return self.buffer.window(self.crop, lag)
 
     def __init__(self,
                  name: str,
@@ -356,33 +741,44 @@ class E2ERocketPuttingIsolation(E2EBaseRocket):
                  crop: slice = slice(0, 300),
                  dimensions_to_remove: list[str] = [],
                  synthesize_dimensions: list[DimensionSynth] = [],
-                 window_size: int = 50):
+                 window_size: int = 50,
+                 batch_budget: int = 0):
         super().__init__(name=name,
                          arm_gyro_x_threshold=23,
                          palm_vibration_threshold=1.75,
                          window_size=window_size,
-                         cooldown_period=50)
+                         cooldown_period=50,
+                         batch_budget=batch_budget)
         self.crop = crop
         self.split = split
         self.dimensions_to_remove = dimensions_to_remove
         self.synthesize_dimensions = synthesize_dimensions
-        if f"{self.name}+{self.split}" not in E2ERocketPuttingIsolation.classifier_dict:
-            E2ERocketPuttingIsolation.classifier_dict[f"{self.name}+{self.split}"] = RocketPuttingIsolation(
-                split,
-                crop=self.crop,
-                dimensions_to_remove=dimensions_to_remove,
-                synthesize_dimensions=synthesize_dimensions
-            )
 
 
 class E2ERocketFullSwingPrime(E2EBaseRocket):
     classifier_dict: dict[str, LaunchpadClassifier] = {}
 
     def get_classifier(self) -> LaunchpadClassifier:
-        return E2ERocketFullSwingPrime.classifier_dict[f"{self.name}+{self.split}"]
+        # Trained on first use, so detectors can be built cheaply to find out their model key
+        key = self.get_model_key()
+        if key not in E2ERocketFullSwingPrime.classifier_dict:
+            E2ERocketFullSwingPrime.classifier_dict[key] = RocketFullSwingRidge(
+                self.split,
+                crop=self.crop,
+                dimensions_to_remove=self.dimensions_to_remove,
+                synthesize_dimensions=self.synthesize_dimensions
+            )
+        return E2ERocketFullSwingPrime.classifier_dict[key]
+
+    def get_model_key(self) -> str | None:
+        synth_names = [d.get_name() for d in self.synthesize_dimensions]
+        return f"E2ERocketFullSwingPrime+{self.split}+{self.crop}+{self.dimensions_to_remove}+{synth_names}"
+
+    def get_data_files(self) -> list[str]:
+        return [self.split]
 
-    def get_samples_for_rocket(self) -> list[WristSample]:
-        return list(self.buffer)[self.crop]
+    def get_samples_for_rocket(self, lag: int = 0) -> SampleBlock:
+        return self.buffer.window(self.crop, lag)
 
     def __init__(self,
                  name: str,
@@ -390,34 +786,45 @@ class E2ERocketFullSwingPrime(E2EBaseRocket):
                  crop: slice = slice(0, 300),
                  dimensions_to_remove: list[str] = [],
                  synthesize_dimensions: list[DimensionSynth] = [],
-                 window_size: int = 80):
+                 window_size: int = 80,
+                 batch_budget: int = 0):
         super().__init__(name=name,
                          palm_vibration_threshold=6,
                          arm_gyro_x_threshold=None,
                          palm_gyro_z_dif_threshold=-100,
                          window_size=window_size,
-                         cooldown_period=75)
+                         cooldown_period=75,
+                         batch_budget=batch_budget)
         self.crop = crop
         self.split = split
         self.dimensions_to_remove = dimensions_to_remove
         self.synthesize_dimensions = synthesize_dimensions
-        if f"{self.name}+{self.split}" not in E2ERocketFullSwingPrime.classifier_dict:
-            E2ERocketFullSwingPrime.classifier_dict[f"{self.name}+{self.split}"] = RocketFullSwingRidge(
-                split,
-                crop=self.crop,
-                dimensions_to_remove=dimensions_to_remove,
-                synthesize_dimensions=synthesize_dimensions
-            )
 
 
 class E2ERocketFullSwingIsolation(E2EBaseRocket):
     classifier_dict: dict[str, LaunchpadClassifier] = {}
 
     def get_classifier(self) -> LaunchpadClassifier:
-        return E2ERocketFullSwingIsolation.classifier_dict[f"{self.name}+{self.split}"]
+        # Trained on first use, so detectors can be built cheaply to find out their model key
+        key = self.get_model_key()
+        if key not in E2ERocketFullSwingIsolation.classifier_dict:
+            E2ERocketFullSwingIsolation.classifier_dict[key] = RocketFullSwingIsolation(
+                self.split,
+                crop=self.crop,
+                dimensions_to_remove=self.dimensions_to_remove,
+                synthesize_dimensions=self.synthesize_dimensions
+            )
+        return E2ERocketFullSwingIsolation.classifier_dict[key]
+
+    def get_model_key(self) -> str | None:
+        synth_names = [d.get_name() for d in self.synthesize_dimensions]
+        return f"E2ERocketFullSwingIsolation+{self.split}+{self.crop}+{self.dimensions_to_remove}+{synth_names}"
+
+    def get_data_files(self) -> list[str]:
+        return [self.split]
 
-    def get_samples_for_rocket(self) -> list[WristSample]:
-        return list(self.buffer)[self.crop]
+    def get_samples_for_rocket(self, lag: int = 0) -> SampleBlock:
+        return self.buffer.window(self.crop, lag)
 
     def __init__(self,
                  name: str,
@@ -425,21 +832,16 @@ class E2ERocketFullSwingIsolation(E2EBaseRocket):
                  crop: slice = slice(0, 300),
                  dimensions_to_remove: list[str] = [],
                  synthesize_dimensions: list[DimensionSynth] = [],
-                 window_size: int = 50):
+                 window_size: int = 50,
+                 batch_budget: int = 0):
         super().__init__(name=name,
                          palm_vibration_threshold=6,
                          arm_gyro_x_threshold=None,
                          palm_gyro_z_dif_threshold=-100,
                          window_size=window_size,
-                         cooldown_period=75)
+                         cooldown_period=75,
+                         batch_budget=batch_budget)
         self.crop = crop
         self.split = split
         self.dimensions_to_remove = dimensions_to_remove
         self.synthesize_dimensions = synthesize_dimensions
-        if f"{self.name}+{self.split}" not in E2ERocketFullSwingIsolation.classifier_dict:
-            E2ERocketFullSwingIsolation.classifier_dict[f"{self.name}+{self.split}"] = RocketFullSwingIsolation(
-                split,
-                crop=self.crop,
-                dimensions_to_remove=dimensions_to_remove,
-                synthesize_dimensions=synthesize_dimensions
-            )
\ No newline at end of file
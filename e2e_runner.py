@@ -1,11 +1,33 @@
-from matplotlib import pyplot as plt
-
-from e2e import E2ERecordResult, E2ERunnerResult, load_raw_dataset, load_data, load_detections, result2precision, \
-    result2recall
+from e2e import E2ERecordResult, E2ERunnerResult, DetectionDataRecord, load_raw_dataset, RecordingReader, load_detections, result2precision, \
+    result2recall, match_detections, result2tolerance_curve
 from e2e_detectors import E2EDetector
-from typing import Callable, Any
+from model_store import ResultStore, default_result_store
+from recording_cache import default_recording_cache
+from render_queue import PlotJob, RenderQueue, render_plots
+from swing_data_instance import DimensionSynth
+from typing import Callable, Any, TypedDict
+import hashlib
+
+import numpy as np
+
+
+# repr that is the same in every process, for hashing configurations
+def stable_repr(value: Any) -> str:
+    if isinstance(value, DimensionSynth):
+        return value.get_name()
+    if isinstance(value, (list, tuple)):
+        return f"[{', '.join(stable_repr(v) for v in value)}]"
+    if isinstance(value, dict):
+        return f"{{{', '.join(f'{k!r}: {stable_repr(value[k])}' for k in sorted(value))}}}"
+    return repr(value)
 
-from visualization import plot_samples
+
+class DetectorInfo(TypedDict):
+    name: str
+    model_key: str | None
+    data_files: list[str]
+    code_files: list[str]
+    config: dict
 
 
 class E2ERunner:
@@ -13,7 +35,11 @@ class E2ERunner:
                  detector_builder: Callable[[], E2EDetector] | None = None,
                  detector_builder_2: Callable[[Any], E2EDetector] | None = None,
                  db2_args: dict = {},
-                 impact_dilation: int = 7):
+                 impact_dilation: int = 7,
+                 tolerances: list[int] = [],
+                 plots: bool = True,
+                 max_plots: int | None = None,
+                 plot_cached: bool = False):
         main_dataset = load_raw_dataset(dataset)
         not_dataset = load_raw_dataset("not")
         self.name = name
@@ -23,112 +49,186 @@ class E2ERunner:
         self.detector_builder_2 = detector_builder_2
         self.db2_args = db2_args
         self.impact_dilation = impact_dilation
+        # Extra tolerances to report totals for, see result2tolerance_curve
+        self.tolerances = tolerances
+        # Whether to save charts of false positives and negatives, and at most how many per run
+        self.plots = plots
+        self.max_plots = max_plots
+        # Whether to also chart records whose detections came from the result store. Off by default, since
+        # cutting the charts reads the whole recording, which is what the result store saves.
+        self.plot_cached = plot_cached
+        # Charts of the last run that are not rendered yet
+        self.plot_jobs: list[PlotJob] = []
+        self.detector_info: DetectorInfo | None = None
 
-    def run(self) -> E2ERunnerResult:
+    def get_builder(self) -> Callable[[], E2EDetector]:
         db = None
         if self.detector_builder is not None:
             db = self.detector_builder
         if self.detector_builder_2 is not None:
             db = lambda a=self.db2_args: self.detector_builder_2(**a)
+        return db
+
+    # Taken from a detector built once per runner, and kept when the runner is sent to a pool worker.
+    # Building detectors has no side effects, training and starting processes wait for the first sample.
+    def get_detector_info(self) -> DetectorInfo:
+        if self.detector_info is None:
+            detector = self.get_builder()()
+            self.detector_info = DetectorInfo(
+                name=detector.get_name(),
+                model_key=detector.get_model_key(),
+                data_files=detector.get_data_files(),
+                code_files=detector.get_code_files(),
+                config=detector.get_config()
+            )
+        return self.detector_info
+
+    def get_model_key(self) -> str | None:
+        return self.get_detector_info()["model_key"]
 
-        records = self.dataset
-        expected_detections = [load_detections(r["detection_path"]) for r in records]
-        all_detections = [[] for x in records]
-        final_result: E2ERunnerResult = E2ERunnerResult(
-            detector_name=db().get_name(),
+    # Same for runners with detectors that detect the same: with the same configuration, and the same contents
+    # of the code and data files. Not how the detector was built, so builders can be edited freely.
+    def get_detector_key(self) -> str:
+        info = self.get_detector_info()
+        h = hashlib.md5(stable_repr(info["config"]).encode())
+        for filename in info["code_files"] + info["data_files"]:
+            h.update(default_recording_cache.file_hash(filename).encode())
+        return h.hexdigest()
+
+    # Same for runners that would give the same results, the name only matters for chart file names
+    def get_config_key(self) -> str:
+        config = stable_repr([self.get_detector_key(), self.dataset_name, self.impact_dilation, self.tolerances])
+        return hashlib.md5(config.encode()).hexdigest()
+
+    def new_result(self) -> E2ERunnerResult:
+        return E2ERunnerResult(
+            detector_name=self.get_detector_info()["name"],
             dataset_name=self.dataset_name,
             record_results=[],
             total_fn=0,
             total_fp=0,
-            total_tp=0
+            total_tp=0,
+            tolerance_results=[]
         )
 
-        for idx, rdr in enumerate(records):
-            # Initialize the detector anew for each run
-            filehash = (rdr["data_path"].split('/')[-1]).split('_')[0]
-            # print(f"Evaluating {filehash}...")
-            detector: E2EDetector = db()
-            samples = load_data(rdr["data_path"], rdr["calibration_path"])
-            for sample in samples:
-                result = detector.add_sample(sample)
-
-                if result is not None:
-                    # print(f"Detected @ {result}")
-                    all_detections[idx].append(result)
-
-            expected = expected_detections[idx]
-            got = all_detections[idx]
-
-            false_positives = 0
-            fp_pos = []
-            true_positives = 0
-            tp_pos = []
-            false_negatives = 0
-            fn_pos = []
-
-            for d in got:
-                dilated = [x for x in range(d - self.impact_dilation, d + self.impact_dilation + 1)]
-                if any(i in dilated for i in expected):
-                    # Was in expected and was in got
-                    true_positives += 1
-                    # Remove the expected value once it's been matched to prevent double
-                    # detections from both counting as a true positive
-                    expected = list(filter(lambda x: x not in dilated, expected))
-                    tp_pos.append(d)
-                else:
-                    # Was not expected, was got
-                    false_positives += 1
-                    fp_pos.append(d)
-
-            for e in expected:
-                dilated = [x for x in range(e - self.impact_dilation, e + self.impact_dilation + 1)]
-                if not any(i in dilated for i in got):
-                    # Was in expected, but not in got
-                    false_negatives += 1
-                    fn_pos.append(e)
+    # Scores the detections in one record and, with plot, saves charts of its false positives and negatives
+    def add_record_result(self, final_result: E2ERunnerResult, rdr: DetectionDataRecord,
+                          recording: RecordingReader, expected_detections: list[int], got: list[int],
+                          plot: bool = True):
+        filehash = (rdr["data_path"].split('/')[-1]).split('_')[0]
+        tp_pos, fp_pos, fn_pos = match_detections(expected_detections, got, self.impact_dilation)
+        true_positives = len(tp_pos)
+        false_positives = len(fp_pos)
+        false_negatives = len(fn_pos)
+        # What is left unmatched, for the chart titles
+        expected = fn_pos
 
+        ds = rdr["data_path"].split('/')[-2]
+        if plot:
             for fp in fp_pos:
-                start_idx = fp - 200
-                end_idx = fp + 100
-                if start_idx < 0:
-                    start_idx = 0
-                if end_idx >= len(samples):
-                    end_idx = len(samples) - 1
-                det_markers = [fp - start_idx]
-                t_markers = [p - start_idx for p in expected_detections[idx]]
-                fig, ax = plot_samples(samples[start_idx:end_idx], det_markers, t_markers)
-                ds = rdr["data_path"].split('/')[-2]
-                fig.suptitle(f"{ds} {filehash} {expected} {got}", fontsize=14)
-                fig.savefig(f"FP-{self.name}-{filehash}-{fp}.png", dpi=100)
-                plt.close(fig)
+                self.add_plot(f"FP-{self.name}-{filehash}-{fp}.png", recording, fp, [fp], expected_detections,
+                              f"{ds} {filehash} {expected} {got}")
 
             for fp in fn_pos:
-                start_idx = fp - 200
-                end_idx = fp + 100
-                if start_idx < 0:
-                    start_idx = 0
-                if end_idx >= len(samples):
-                    end_idx = len(samples) - 1
-                det_markers = [p - start_idx for p in got]
-                t_markers = [p - start_idx for p in expected_detections[idx]]
-                fig, ax = plot_samples(samples[start_idx:end_idx], det_markers, t_markers)
-                ds = rdr["data_path"].split('/')[-2]
-                fig.suptitle(f"{ds} {filehash} {expected} {got}", fontsize=14)
-                fig.savefig(f"FN-{self.name}-{filehash}-{fp}.png", dpi=100)
-                plt.close(fig)
-
-            final_result["total_tp"] += true_positives
-            final_result["total_fp"] += false_positives
-            final_result["total_fn"] += false_negatives
-            final_result["record_results"].append(E2ERecordResult(
-                expected=expected_detections[idx],
-                got=all_detections[idx],
-                false_positives=false_positives,
-                false_negatives=false_negatives,
-                true_positives=true_positives
-            ))
-
-        return final_result
+                self.add_plot(f"FN-{self.name}-{filehash}-{fp}.png", recording, fp, got, expected_detections,
+                              f"{ds} {filehash} {expected} {got}")
+
+        final_result["total_tp"] += true_positives
+        final_result["total_fp"] += false_positives
+        final_result["total_fn"] += false_negatives
+        final_result["record_results"].append(E2ERecordResult(
+            expected=expected_detections,
+            got=got,
+            false_positives=false_positives,
+            false_negatives=false_negatives,
+            true_positives=true_positives
+        ))
+
+    # Only cuts out the samples around pos, the chart is rendered later by render()
+    def add_plot(self, filename: str, recording: RecordingReader, pos: int,
+                 det_markers: list[int], truth_markers: list[int], title: str):
+        if not self.plots or (self.max_plots is not None and len(self.plot_jobs) >= self.max_plots):
+            return
+        start_idx = pos - 200
+        end_idx = pos + 100
+        if start_idx < 0:
+            start_idx = 0
+        if end_idx >= len(recording):
+            end_idx = len(recording) - 1
+        self.plot_jobs.append(PlotJob(
+            filename=filename,
+            samples=np.array(recording.read(start_idx, end_idx).data),
+            det_markers=[p - start_idx for p in det_markers],
+            truth_markers=[p - start_idx for p in truth_markers],
+            title=title
+        ))
+
+    # Renders the charts of the last run, in the render queue if there is one, or here
+    def render(self, render_queue: RenderQueue | None = None):
+        if render_queue is None:
+            render_plots(self.plot_jobs)
+        else:
+            render_queue.submit(self.plot_jobs)
+        self.plot_jobs = []
+
+    def run(self, render_queue: RenderQueue | None = None) -> E2ERunnerResult:
+        res = run_together([self])[0]
+        self.render(render_queue)
+        return res
+
+
+# Runs runners on the same dataset in a single pass over it. Every recording is loaded and iterated
+# once, and each sample is given to a detector of every runner. Results are the same as from run().
+# Detections are kept in the result store by detector and recording contents, so they are only
+# detected again when either changed. Scores always use the current labels.
+# Charts are left in the runners' plot_jobs, see E2ERunner.render. Records served from the result store
+# are only charted for runners with plot_cached.
+def run_together(runners: list[E2ERunner],
+                 result_store: ResultStore | None = default_result_store) -> list[E2ERunnerResult]:
+    records = runners[0].dataset
+    if any(r.dataset != records for r in runners):
+        raise ValueError("Runners can only run together on the same dataset")
+    builders = [r.get_builder() for r in runners]
+    for r in runners:
+        r.plot_jobs = []
+    detector_keys = [r.get_detector_key() for r in runners]
+    results = [r.new_result() for r in runners]
+
+    for rdr in records:
+        expected = load_detections(rdr["detection_path"])
+        recording_key = default_recording_cache.key(rdr["data_path"], rdr["calibration_path"])
+        all_detections: list[list[int] | None] = [None for _ in runners]
+        if result_store is not None:
+            all_detections = [result_store.load(k, recording_key) for k in detector_keys]
+        to_run = [idx for idx, d in enumerate(all_detections) if d is None]
+
+        recording = RecordingReader(rdr["data_path"], rdr["calibration_path"])
+        if len(to_run) > 0:
+            # Initialize the detectors anew for each run
+            detectors: list[E2EDetector] = [builders[idx]() for idx in to_run]
+            detections: list[list[int]] = [[] for _ in to_run]
+            for block in recording.blocks():
+                for sample in block:
+                    for detector, found in zip(detectors, detections):
+                        result = detector.add_sample(sample)
+
+                        if result is not None:
+                            found.append(result)
+
+            for idx, detector, found in zip(to_run, detectors, detections):
+                found += detector.finish()
+                all_detections[idx] = found
+                if result_store is not None:
+                    result_store.save(detector_keys[idx], recording_key, found)
+
+        # The recording is only read for charts of detections made in this run, unless asked for
+        for idx, (runner, final_result, found) in enumerate(zip(runners, results, all_detections)):
+            runner.add_record_result(final_result, rdr, recording, expected, found,
+                                     plot=idx in to_run or runner.plot_cached)
+
+    for runner, final_result in zip(runners, results):
+        final_result["tolerance_results"] = result2tolerance_curve(final_result, runner.tolerances)
+    return results
 
 
 def print_results(res: E2ERunnerResult):
@@ -139,6 +239,8 @@ def print_results(res: E2ERunnerResult):
     print(f"Total false positives: {res['total_fp']}")
     print(f"Total false negatives: {res['total_fn']}")
     print(f"Precision: {(precision * 100):.1f}%\t Recall: {(recall * 100):.1f}%")
+    for t in res.get('tolerance_results', []):
+        print(f"  +-{t['tolerance']}: TP {t['total_tp']}\t FP {t['total_fp']}\t FN {t['total_fn']}")
     print("---------------------------------")
 
 
@@ -149,6 +251,63 @@ def save_results(writer, id: int, runner: E2ERunner, res: E2ERunnerResult):
 
 def execute_runner(id: int, r: E2ERunner) -> (int, E2ERunner, E2ERunnerResult):
     print(f"Running {r.name}")
-    res = r.run()
+    # Charts are left on the runner, workers of a pool can't have a render pool of their own
+    res = run_together([r])[0]
     print_results(res)
-    return id, r, res
\ No newline at end of file
+    return id, r, res
+
+
+# Runners of a group that are on the same dataset run together, fanout at a time
+def execute_runner_group(group: list[tuple[int, E2ERunner]],
+                         fanout: int = 8) -> list[tuple[int, E2ERunner, E2ERunnerResult]]:
+    by_dataset: dict[str, list[tuple[int, E2ERunner]]] = {}
+    for id, r in group:
+        by_dataset.setdefault(r.dataset_name, []).append((id, r))
+    ret = []
+    for same_dataset in by_dataset.values():
+        for start in range(0, len(same_dataset), fanout):
+            batch = same_dataset[start:start + fanout]
+            for id, r in batch:
+                print(f"Running {r.name}")
+            for (id, r), res in zip(batch, run_together([r for _, r in batch])):
+                print_results(res)
+                ret.append((id, r, res))
+    return ret
+
+
+# Runs all runners in the pool, with runners that need the same model sent to the same worker,
+# so every model is trained once per sweep instead of once in every worker that happens to need it.
+# Runners without a model on the same dataset are sent together fanout at a time, so they share
+# their passes over the recordings.
+# Charts are rendered in render_queue, or a queue of its own, as soon as each group is done.
+def execute_runners(pool, runners: list[E2ERunner], fanout: int = 8,
+                    render_queue: RenderQueue | None = None) -> list[tuple[int, E2ERunner, E2ERunnerResult]]:
+    model_groups: dict[str, list[tuple[int, E2ERunner]]] = {}
+    dataset_groups: dict[str, list[tuple[int, E2ERunner]]] = {}
+    for id, r in enumerate(runners):
+        key = r.get_model_key()
+        if key is None:
+            # Nothing to share but the recordings
+            dataset_groups.setdefault(r.dataset_name, []).append((id, r))
+        else:
+            model_groups.setdefault(key, []).append((id, r))
+    groups = list(model_groups.values())
+    for same_dataset in dataset_groups.values():
+        groups += [same_dataset[start:start + fanout] for start in range(0, len(same_dataset), fanout)]
+    print(f"Running {len(runners)} runners, {len(model_groups)} models to train")
+
+    # Start with the largest groups so a big one doesn't end up running alone at the end
+    groups.sort(key=len, reverse=True)
+    processes = [pool.apply_async(execute_runner_group, args=(g, fanout)) for g in groups]
+    own_queue = render_queue is None
+    if own_queue:
+        render_queue = RenderQueue()
+    results = []
+    for p in processes:
+        for id, r, res in p.get():
+            r.render(render_queue)
+            results.append((id, r, res))
+    if own_queue:
+        render_queue.close()
+    results.sort(key=lambda x: x[0])
+    return results
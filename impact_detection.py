@@ -1,5 +1,5 @@
 import enum
-from sensor_data_types import WristSample
+from sensor_data_types import WristSample, SampleBlock, wristSample2sampleBlock
 import numpy as np
 
 
@@ -10,63 +10,41 @@ def chunks(l, n):
 
 
 # Find impacts and return the index of their position
-def find_impacts(samples: list[WristSample],
+def find_impacts(samples: list[WristSample] | SampleBlock,
                  palmVibrationThreshold: float = 1,
                  armGyroNormThreshold: float = 30,
                  minSpacing: int = 100) -> list[int]:
-    # Peak value and index in impact
-    impacts: list[(float, int)] = []
-    # Check each window for peak impact
-    for w, idxs in chunks(samples, minSpacing):
-        w_acc_norms = []
-        w_gyro_norms = []
-        last_acc_norm = 0
-        for i, s in enumerate(w):
-            acc_norm = np.linalg.norm(s['palm_acc'])
-            gyro_norm = np.linalg.norm(s['arm_gyro'])
-            acc_norm_dif = abs(last_acc_norm - acc_norm)
-            last_acc_norm = acc_norm
-            w_acc_norms.append(acc_norm)
-            w_gyro_norms.append(gyro_norm)
+    block = wristSample2sampleBlock(samples)
+    minSpacing = max(1, minSpacing)
+    if len(block) == 0:
+        return []
 
-        current_peak_idx = -1
-        current_peak_value = -1
-        for i in range(len(w_acc_norms)):
-            if (w_acc_norms[i] > palmVibrationThreshold) and (w_gyro_norms[i] > armGyroNormThreshold):
-                if w_acc_norms[i] > current_peak_value:
-                    current_peak_value = w_acc_norms[i]
-                    current_peak_idx = i
+    acc_norms = np.linalg.norm(block.palm_acc, axis=1)
+    gyro_norms = np.linalg.norm(block.arm_gyro, axis=1)
+    candidates = np.where((acc_norms > palmVibrationThreshold) & (gyro_norms > armGyroNormThreshold),
+                          acc_norms, -np.inf)
 
-        if current_peak_idx != -1:
-            impacts.append((current_peak_value, current_peak_idx+idxs[0]))
+    # Pad the last window so every window of minSpacing samples is a row, then take the peak of each row.
+    # argmax returns the first maximum, same as a strict > scan would
+    pad = (-len(candidates)) % minSpacing
+    windows = np.pad(candidates, (0, pad), constant_values=-np.inf).reshape(-1, minSpacing)
+    peak_offsets = np.argmax(windows, axis=1)
+    peak_values = windows[np.arange(len(windows)), peak_offsets]
+    has_peak = peak_values > -np.inf
 
-    # Sort impacts by peak
-    impacts.sort(key=lambda x: x[0], reverse=True)
-    # Check if an impact is allowed to be detected on this sample
-    '''
-    next_impact_sample = 1
-    for i, s in enumerate(samples):
-        acc_norm = np.linalg.norm(s['palm_acc'])
-        gyro_norm = np.linalg.norm(s['arm_gyro'])
-        acc_norm_dif = abs(last_acc_norm - acc_norm)
-        last_acc_norm = acc_norm
-        if i < next_impact_sample:
-            # 1st sample may report impact if extreme enough motion was at the beginning
-            continue
-        if (acc_norm_dif > palmVibrationThreshold) and (gyro_norm > armGyroNormThreshold):
-            impacts.append(i)
-            next_impact_sample = i + minSpacing
-            print(f" * Found impact @ {i}, accNormDif: {acc_norm_dif:.2f} gyroNorm: {gyro_norm:.2f}")
-    '''
-    return list(map(lambda x: x[1], impacts))
-    # return impacts
+    peak_idxs = (np.arange(len(windows)) * minSpacing + peak_offsets)[has_peak]
+    peak_values = peak_values[has_peak]
+
+    # Sort impacts by peak, stable so equal peaks keep their order in the recording
+    order = np.argsort(-peak_values, kind='stable')
+    return peak_idxs[order].tolist()
 
 
-def impacts2snippets(samples: list[WristSample],
+def impacts2snippets(samples: list[WristSample] | SampleBlock,
                      impacts: list[int],
                      before: int = 200,
-                     after: int = 100) -> list[list[WristSample]]:
-    snippets: list[list[WristSample]] = []
+                     after: int = 100) -> list[list[WristSample] | SampleBlock]:
+    snippets: list[list[WristSample] | SampleBlock] = []
     for impact in impacts:
         min_range = impact - before
         max_range = impact + after
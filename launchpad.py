@@ -4,188 +4,269 @@ from sklearn.linear_model import RidgeClassifierCV
 from sklearn.pipeline import make_pipeline
 from sklearn.preprocessing import StandardScaler
 from sktime.transformations.panel.rocket import MiniRocketMultivariate
+from model_store import ModelStore, default_model_store, FeatureCache, default_feature_cache, model_key
 from swing_data_instance import *
 
 
 class LaunchpadClassifier:
-    def is_swing(self, samples: list[WristSample]) -> bool:
+    # Prediction that means "swing"
+    swing_prediction: int
+    classes_to_remove: list[int] = []
+    class_remap: dict[int, int] = {}
+    # Ridge classifiers are trained on labelled data and scored on the test set, Isolation ones are not
+    supervised: bool
+    crop: slice | None
+    dimensions_to_remove: list[str]
+    synthesize_dimensions: list[DimensionSynth]
+    random_state: int | None
+
+    def make_pipeline(self):
         pass
 
+    # Loads one half of the split and post-processes it, reading only the classes, channels and
+    # samples that are used
+    def load_panel(self, split_path: str, train: bool) -> (np.ndarray, np.ndarray):
+        channels, dimensions_to_remove = skd_array_source_channels(self.synthesize_dimensions,
+                                                                   self.dimensions_to_remove)
+        loaded_train, loaded_test = sdi_load_split_panels(split_path, load_test=not train, load_train=train,
+                                                          classes_to_remove=self.classes_to_remove,
+                                                          class_remap=self.class_remap,
+                                                          crop_series_rows=self.crop,
+                                                          channels=channels)
+        panel, classes = loaded_train if train else loaded_test
+        return skd_array_post_process(panel, classes,
+                                      classes_to_remove=self.classes_to_remove,
+                                      class_remap=self.class_remap,
+                                      dimensions_to_remove=dimensions_to_remove,
+                                      synthesize_dimensions=self.synthesize_dimensions,
+                                      channels=channels)
+
+    def get_model_key(self, split_path: str) -> str:
+        return model_key(split_path,
+                         classifier=type(self).__name__,
+                         crop=self.crop,
+                         dimensions_to_remove=self.dimensions_to_remove,
+                         synthesize_dimensions=[d.get_name() for d in self.synthesize_dimensions],
+                         classes_to_remove=self.classes_to_remove,
+                         class_remap=self.class_remap,
+                         pipeline=[repr(step) for step in self.make_pipeline()],
+                         random_state=self.random_state)
+
+    # Training features only depend on which snippets are used and the transform, not on the estimator
+    def get_feature_key(self, split_path: str) -> str:
+        return model_key(split_path,
+                         crop=self.crop,
+                         dimensions_to_remove=self.dimensions_to_remove,
+                         synthesize_dimensions=[d.get_name() for d in self.synthesize_dimensions],
+                         classes_to_remove=self.classes_to_remove,
+                         class_remap=self.class_remap,
+                         transform=repr(self.make_pipeline()[0]),
+                         random_state=self.random_state)
+
+    def load_or_transform(self, split_path: str, feature_cache: FeatureCache | None) -> dict:
+        key = self.get_feature_key(split_path)
+        if feature_cache is not None:
+            cached = feature_cache.load(key)
+            # Entries made before the column names were kept can't be fitted on like the transform's output
+            if cached is not None and 'columns' in cached:
+                print(f"Loaded training features {key} from feature cache")
+                return cached
+
+        train_panel, train_classes = self.load_panel(split_path, train=True)
+
+        print(f"Transforming training data for {type(self).__name__}...")
+        transform = self.make_pipeline()[0]
+        transformed = transform.fit_transform(train_panel)
+        features = np.asarray(transformed)
+        entry = {
+            'transform': transform,
+            'features': features,
+            # Column names of the DataFrame the transform returns, None if it returns an array
+            'columns': list(transformed.columns) if isinstance(transformed, pd.DataFrame) else None,
+            'classes': train_classes,
+            'train_data_size': train_panel.shape[2]
+        }
+        if feature_cache is not None:
+            feature_cache.save(key, features,
+                               transform=transform,
+                               columns=entry['columns'],
+                               classes=train_classes,
+                               train_data_size=entry['train_data_size'])
+        return entry
+
+    def load_or_train(self, split_path: str, score_on_init: bool, model_store: ModelStore | None,
+                      feature_cache: FeatureCache | None):
+        key = self.get_model_key(split_path)
+        if model_store is not None:
+            stored = model_store.load(key)
+            if stored is not None:
+                self.pipeline = stored['pipeline']
+                self.train_data_size = stored['train_data_size']
+                print(f"Loaded {type(self).__name__} {key} from model store")
+                if stored['score'] is not None:
+                    print(f"Initialized with score {stored['score']}")
+                return
+
+        train = self.load_or_transform(split_path, feature_cache)
+        self.train_data_size = train['train_data_size']
+
+        print(f"Initializing {type(self).__name__}...")
+        # Same as fitting the whole pipeline, with the already fitted transform put in front
+        self.pipeline = self.make_pipeline()
+        self.pipeline.steps[0] = (self.pipeline.steps[0][0], train['transform'])
+        # The rest is fitted on what the transform gives it when predicting, a DataFrame with the same columns,
+        # so it doesn't warn about feature names on every prediction
+        features = train['features']
+        if train['columns'] is not None:
+            features = pd.DataFrame(features, columns=train['columns'])
+        if self.supervised:
+            self.pipeline[1:].fit(features, train['classes'])
+        else:
+            self.pipeline[1:].fit(features)
+
+        self_score = None
+        # Test data is only needed for scoring
+        if self.supervised and score_on_init:
+            test_panel, test_classes = self.load_panel(split_path, train=False)
+            self_score = self.pipeline.score(test_panel, test_classes)
+            print(f"Initialized with score {self_score}")
+
+        if model_store is not None:
+            model_store.save(key, {
+                'pipeline': self.pipeline,
+                'train_data_size': self.train_data_size,
+                'score': self_score
+            })
+
+    def is_swing(self, samples: list[WristSample] | SampleBlock) -> bool:
+        return self.is_swing_batch([samples])[0]
+
+    def is_swing_batch(self, windows: list[list[WristSample] | SampleBlock]) -> list[bool]:
+        # Classifies all windows with a single pipeline call, which shares its fixed cost between them
+        results = [False for _ in windows]
+        # Should test with the same amount of samples as was training data length
+        usable = [idx for idx, w in enumerate(windows) if len(w) == self.train_data_size]
+        if len(usable) == 0:
+            return results
+
+        # Skips the nested DataFrame, the pipeline takes the array and produces the same features from it
+        data, _ = skd_array_post_process(wristSample2panel([windows[idx] for idx in usable]),
+                                         synthesize_dimensions=self.synthesize_dimensions,
+                                         dimensions_to_remove=self.dimensions_to_remove)
+        predictions = self.pipeline.predict(data)
+        for idx, p in zip(usable, predictions):
+            results[idx] = p == self.swing_prediction
+        return results
+
 
 class RocketPuttingRidge(LaunchpadClassifier):
-    def post_process(self, pd, classes, crop) -> pd.DataFrame:
-        return skd_post_process(pd, classes,
-                                classes_to_remove=[5, 6, 7],
-                                class_remap={1: 0, 2: 0, 3: 0, 4: 0},
-                                crop_series_rows=crop,
-                                dimensions_to_remove=self.dimensions_to_remove,
-                                synthesize_dimensions=self.synthesize_dimensions)
+    swing_prediction = 8
+    classes_to_remove = [5, 6, 7]
+    class_remap = {1: 0, 2: 0, 3: 0, 4: 0}
+    supervised = True
+
+    def make_pipeline(self):
+        return make_pipeline(
+            MiniRocketMultivariate(random_state=self.random_state), StandardScaler(with_mean=False),
+            RidgeClassifierCV(alphas=np.logspace(-3, 3, 10)),
+            verbose=True
+        )
 
     def __init__(self,
                  split_path: str,
                  crop: slice | None = None,
                  dimensions_to_remove: list[str] = [],
-                 synthesize_dimensions: list[DimensionSynth] = []):
+                 synthesize_dimensions: list[DimensionSynth] = [],
+                 random_state: int | None = None,
+                 score_on_init: bool = True,
+                 model_store: ModelStore | None = default_model_store,
+                 feature_cache: FeatureCache | None = default_feature_cache):
         self.crop = crop
         self.dimensions_to_remove = dimensions_to_remove
         self.synthesize_dimensions = synthesize_dimensions
+        self.random_state = random_state
+        self.load_or_train(split_path, score_on_init, model_store, feature_cache)
 
-        train_data, test_data = sdi_load_split(split_path)
-        train_pd, train_classes = sdiList2sktimeData(train_data)
-        test_pd, test_classes = sdiList2sktimeData(test_data)
-        train_pd = self.post_process(train_pd, train_classes, crop)
-        test_pd = self.post_process(test_pd, test_classes, crop)
-        self.train_data_size = len(train_pd.iat[0, 0])
-
-        train_data.clear()
-        test_data.clear()
 
-        print("Initializing RocketPuttingRidge...")
-        self.pipeline = make_pipeline(
-            MiniRocketMultivariate(), StandardScaler(with_mean=False), RidgeClassifierCV(alphas=np.logspace(-3, 3, 10)),
+class RocketFullSwingRidge(LaunchpadClassifier):
+    swing_prediction = 4
+    classes_to_remove = [1, 2, 3, 5, 6, 7, 8]
+    # class_remap = {5: 0, 6: 0, 7: 0, 8: 0}
+    supervised = True
+
+    def make_pipeline(self):
+        return make_pipeline(
+            MiniRocketMultivariate(random_state=self.random_state), StandardScaler(with_mean=False),
+            RidgeClassifierCV(alphas=np.logspace(-3, 3, 10)),
             verbose=True
         )
 
-        self.pipeline.fit(train_pd, train_classes)
-        self_score = self.pipeline.score(test_pd, test_classes)
-        print(f"Initialized with score {self_score}")
-
-    def is_swing(self, samples: list[WristSample]) -> bool:
-        data = wristSample2sktimeData(samples)
-        data = self.post_process(data, [8], None)
-        if len(data.iat[0, 0]) != self.train_data_size:
-            # print(f"Should test with the same amount of samples as was training data length ({len(samples)} vs {self.train_data_size})")
-            return False
-        predictions = self.pipeline.predict(data)
-        return predictions[0] == 8
-
-
-class RocketFullSwingRidge(LaunchpadClassifier):
-    def post_process(self, pd, classes, crop) -> pd.DataFrame:
-        return skd_post_process(pd, classes,
-                                classes_to_remove=[1, 2, 3, 5, 6, 7, 8],
-                                #class_remap={5: 0, 6: 0, 7: 0, 8: 0},
-                                crop_series_rows=crop,
-                                dimensions_to_remove=self.dimensions_to_remove,
-                                synthesize_dimensions=self.synthesize_dimensions)
-
     def __init__(self,
                  split_path: str,
                  crop: slice | None = None,
                  dimensions_to_remove: list[str] = [],
-                 synthesize_dimensions: list[DimensionSynth] = []):
+                 synthesize_dimensions: list[DimensionSynth] = [],
+                 random_state: int | None = None,
+                 score_on_init: bool = True,
+                 model_store: ModelStore | None = default_model_store,
+                 feature_cache: FeatureCache | None = default_feature_cache):
+        self.crop = crop
         self.dimensions_to_remove = dimensions_to_remove
         self.synthesize_dimensions = synthesize_dimensions
+        self.random_state = random_state
+        self.load_or_train(split_path, score_on_init, model_store, feature_cache)
 
-        train_data, test_data = sdi_load_split(split_path)
-        train_pd, train_classes = sdiList2sktimeData(train_data)
-        test_pd, test_classes = sdiList2sktimeData(test_data)
-        train_pd = self.post_process(train_pd, train_classes, crop)
-        test_pd = self.post_process(test_pd, test_classes, crop)
-        self.train_data_size = len(train_pd.iat[0, 0])
 
-        train_data.clear()
-        test_data.clear()
-
-        print("Initializing RocketFullSwingRidge...")
-        self.pipeline = make_pipeline(
-            MiniRocketMultivariate(), StandardScaler(with_mean=False), RidgeClassifierCV(alphas=np.logspace(-3, 3, 10)),
+class RocketPuttingIsolation(LaunchpadClassifier):
+    swing_prediction = 1
+    classes_to_remove = [5, 6, 7]
+    class_remap = {1: 0, 2: 0, 3: 0, 4: 0}
+    supervised = False
+
+    def make_pipeline(self):
+        return make_pipeline(
+            MiniRocketMultivariate(random_state=self.random_state), StandardScaler(with_mean=False),
+            IsolationForest(random_state=self.random_state),
             verbose=True
         )
 
-        self.pipeline.fit(train_pd, train_classes)
-        self_score = self.pipeline.score(test_pd, test_classes)
-        print(f"Initialized with score {self_score}")
-
-    def is_swing(self, samples: list[WristSample]) -> bool:
-        data = wristSample2sktimeData(samples)
-        data = self.post_process(data, [4], None)
-        if len(data.iat[0, 0]) != self.train_data_size:
-            # print(f"Should test with the same amount of samples as was training data length ({len(samples)} vs {self.train_data_size})")
-            return False
-        predictions = self.pipeline.predict(data)
-        return predictions[0] == 4
-
-
-class RocketPuttingIsolation(LaunchpadClassifier):
-    def post_process(self, pd, classes, crop) -> pd.DataFrame:
-        return skd_post_process(pd, classes,
-                                classes_to_remove=[5, 6, 7],
-                                class_remap={1: 0, 2: 0, 3: 0, 4: 0},
-                                crop_series_rows=crop,
-                                dimensions_to_remove=self.dimensions_to_remove,
-                                synthesize_dimensions=self.synthesize_dimensions)
-
     def __init__(self,
                  split_path: str,
                  crop: slice | None = None,
                  dimensions_to_remove: list[str] = [],
-                 synthesize_dimensions: list[DimensionSynth] = []):
+                 synthesize_dimensions: list[DimensionSynth] = [],
+                 random_state: int | None = None,
+                 model_store: ModelStore | None = default_model_store,
+                 feature_cache: FeatureCache | None = default_feature_cache):
         self.crop = crop
         self.dimensions_to_remove = dimensions_to_remove
         self.synthesize_dimensions = synthesize_dimensions
+        self.random_state = random_state
+        self.load_or_train(split_path, False, model_store, feature_cache)
 
-        train_data, test_data = sdi_load_split(split_path)
-        train_pd, train_classes = sdiList2sktimeData(train_data)
-        train_pd = self.post_process(train_pd, train_classes, crop)
-        self.train_data_size = len(train_pd.iat[0, 0])
-
-        train_data.clear()
 
-        print("Initializing RocketPuttingIsolation...")
-        self.pipeline = make_pipeline(
-            MiniRocketMultivariate(), StandardScaler(with_mean=False), IsolationForest(),
+class RocketFullSwingIsolation(LaunchpadClassifier):
+    swing_prediction = 1
+    classes_to_remove = [0, 1, 2, 3, 5, 6, 7, 8]
+    supervised = False
+
+    def make_pipeline(self):
+        return make_pipeline(
+            MiniRocketMultivariate(random_state=self.random_state), StandardScaler(with_mean=False),
+            IsolationForest(random_state=self.random_state),
             verbose=True
         )
 
-        self.pipeline.fit(train_pd)
-
-    def is_swing(self, samples: list[WristSample]) -> bool:
-        data = wristSample2sktimeData(samples)
-        data = self.post_process(data, [8], None)
-        if len(data.iat[0, 0]) != self.train_data_size:
-            # print(f"Should test with the same amount of samples as was training data length ({len(samples)} vs {self.train_data_size})")
-            return False
-        predictions = self.pipeline.predict(data)
-        return predictions[0] == 1
-
-
-class RocketFullSwingIsolation(LaunchpadClassifier):
-    def post_process(self, pd, classes, crop) -> pd.DataFrame:
-        return skd_post_process(pd, classes,
-                                classes_to_remove=[0, 1, 2, 3, 5, 6, 7, 8],
-                                crop_series_rows=crop,
-                                dimensions_to_remove=self.dimensions_to_remove,
-                                synthesize_dimensions=self.synthesize_dimensions)
-
     def __init__(self,
                  split_path: str,
                  crop: slice | None = None,
                  dimensions_to_remove: list[str] = [],
-                 synthesize_dimensions: list[DimensionSynth] = []):
+                 synthesize_dimensions: list[DimensionSynth] = [],
+                 random_state: int | None = None,
+                 model_store: ModelStore | None = default_model_store,
+                 feature_cache: FeatureCache | None = default_feature_cache):
+        self.crop = crop
         self.dimensions_to_remove = dimensions_to_remove
         self.synthesize_dimensions = synthesize_dimensions
-
-        train_data, test_data = sdi_load_split(split_path)
-        train_pd, train_classes = sdiList2sktimeData(train_data)
-        train_pd = self.post_process(train_pd, train_classes, crop)
-        self.train_data_size = len(train_pd.iat[0, 0])
-
-        train_data.clear()
-
-        print("Initializing RocketFullSwingIsolation...")
-        self.pipeline = make_pipeline(
-            MiniRocketMultivariate(), StandardScaler(with_mean=False), IsolationForest(),
-            verbose=True
-        )
-
-        self.pipeline.fit(train_pd)
-
-    def is_swing(self, samples: list[WristSample]) -> bool:
-        data = wristSample2sktimeData(samples)
-        data = self.post_process(data, [4], None)
-        if len(data.iat[0, 0]) != self.train_data_size:
-            # print(f"Should test with the same amount of samples as was training data length ({len(samples)} vs {self.train_data_size})")
-            return False
-        predictions = self.pipeline.predict(data)
-        return predictions[0] == 1
+        self.random_state = random_state
+        self.load_or_train(split_path, False, model_store, feature_cache)
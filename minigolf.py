@@ -1,9 +1,12 @@
 from matplotlib import lines
 from sensor_data_types import WristSample, DominantHand, WornHand
 from typing import TypedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import atexit
 import enum
 import os
 import subprocess
+import threading
 
 class MinigolfDetector(enum.Enum):
     FULLSWING = 0
@@ -41,13 +44,78 @@ def convert_to_minigolf(
         )
     return lines
 
-def run(data: list[str]) -> MinigolfResult | None:
-    mgp = subprocess.Popen("./minigolf",
+def start_minigolf() -> subprocess.Popen:
+    return subprocess.Popen("./minigolf",
         stdin=subprocess.PIPE,
         stdout=subprocess.PIPE,
         text=True,
         bufsize=1)
 
+# Minigolf processes started ahead of time, so starting one is not paid for when a run needs it.
+# Minigolf only reads its configuration as the first line and can't be reset, so every process runs
+# a single configuration, so this only takes starting processes off the critical path, it doesn't start fewer.
+# A process for the next run is started in the background as soon as one is taken, and runs of several
+# configurations run concurrently, each in its own process. Nothing is started before the first run.
+class MinigolfPool:
+    def __init__(self, size: int = 8):
+        self.size = size
+        self.hooks_registered = False
+        self.forget()
+
+    def forget(self):
+        self.lock = threading.Lock()
+        self.starter: ThreadPoolExecutor | None = None
+        self.runner: ThreadPoolExecutor | None = None
+        self.standby: list[Future] = []
+
+    def acquire(self) -> subprocess.Popen:
+        with self.lock:
+            if not self.hooks_registered:
+                # Threads and the processes of the parent are not ours in a forked child
+                os.register_at_fork(after_in_child=self.forget)
+                atexit.register(self.close)
+                self.hooks_registered = True
+            if self.starter is None:
+                self.starter = ThreadPoolExecutor(max_workers=self.size)
+                self.runner = ThreadPoolExecutor(max_workers=self.size)
+            while len(self.standby) < self.size:
+                self.standby.append(self.starter.submit(start_minigolf))
+            started = self.standby.pop(0)
+        return started.result()
+
+    # Runs every configuration's data, which starts with its configuration line, in its own process
+    def run_all(self, all_data: list[list[str]]) -> list[MinigolfResult | None]:
+        processes = [self.acquire() for _ in all_data]
+        runs = [self.runner.submit(run_in, mgp, data) for mgp, data in zip(processes, all_data)]
+        return [r.result() for r in runs]
+
+    def close(self):
+        with self.lock:
+            standby, self.standby = self.standby, []
+            for p in standby:
+                try:
+                    p.result().terminate()
+                except OSError:
+                    # Never started, like when there is no ./minigolf
+                    pass
+            if self.starter is not None:
+                self.starter.shutdown()
+                self.runner.shutdown()
+            self.starter = None
+            self.runner = None
+
+
+_default_minigolf_pool: MinigolfPool | None = None
+
+
+# Made on first use, so importing this module starts nothing and registers no hooks
+def default_minigolf_pool() -> MinigolfPool:
+    global _default_minigolf_pool
+    if _default_minigolf_pool is None:
+        _default_minigolf_pool = MinigolfPool()
+    return _default_minigolf_pool
+
+def run_in(mgp: subprocess.Popen, data: list[str]) -> MinigolfResult | None:
     # 1st line must be metadata and will have no reponse from minigolf
     # 1st line: 0 for left handed, 1 for right handed
     # 2nd line: 0 for trail wrist, 1 for lead wrist
@@ -80,17 +148,27 @@ def run(data: list[str]) -> MinigolfResult | None:
     mgp.terminate()
     return result
 
+def run(data: list[str], pool: MinigolfPool | None = None) -> MinigolfResult | None:
+    if pool is None:
+        pool = default_minigolf_pool()
+    return run_in(pool.acquire(), data)
+
 def run_configs(
     samples: list[WristSample],
-    configs: list[MinigolfConfig]) -> list[MinigolfRun]:
-    results: list[MinigolfRun] = []
+    configs: list[MinigolfConfig],
+    pool: MinigolfPool | None = None) -> list[MinigolfRun]:
+    if pool is None:
+        pool = default_minigolf_pool()
+    all_data = []
     for c in configs:
+        print(f" * Running with config {c}")
+        all_data.append(convert_to_minigolf(samples, c["dominantHand"], c["wornHand"], c["detector"]))
+
+    results: list[MinigolfRun] = []
+    for c, result in zip(configs, pool.run_all(all_data)):
         this_run = MinigolfRun()
         this_run["config"] = c
-        print(f" * Running with config {c}")
-        mgd = convert_to_minigolf(samples, c["dominantHand"], c["wornHand"], c["detector"])
-        this_run["result"] = run(mgd)
-        
+        this_run["result"] = result
         results.append(this_run)
     return results
 
@@ -0,0 +1,173 @@
+import hashlib
+import os
+import pickle
+import shutil
+import typing
+from pathlib import Path
+
+import numpy as np
+
+
+# Removes the least recently used entries until the total size fits in max_bytes
+def evict_lru(entries: list[tuple[float, int, Path]], max_bytes: int, keep: Path | None = None):
+    total = sum(e[1] for e in entries)
+    entries.sort()
+    for mtime, size, p in entries:
+        if total <= max_bytes:
+            break
+        if p == keep:
+            continue
+        print(f"Evicting {p}")
+        if p.is_dir():
+            shutil.rmtree(p, ignore_errors=True)
+        else:
+            p.unlink(missing_ok=True)
+        total -= size
+
+
+# Stores fitted models on disk so they don't have to be trained again in every process.
+# When the store grows past max_bytes, the least recently used entries are removed.
+class ModelStore:
+    def __init__(self, path: str = "model_store/", max_bytes: int = 4 * 1024 ** 3):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+
+    def entry_path(self, key: str) -> Path:
+        return self.path / f"{key}.pck"
+
+    def load(self, key: str) -> typing.Any | None:
+        path = self.entry_path(key)
+        try:
+            with open(path, "rb") as file:
+                entry = pickle.load(file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        # Loading counts as a use for eviction
+        os.utime(path)
+        return entry
+
+    def save(self, key: str, entry: typing.Any):
+        self.path.mkdir(parents=True, exist_ok=True)
+        path = self.entry_path(key)
+        # Write to a temporary file first so other processes never load a half written model
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as file:
+            pickle.dump(entry, file)
+        os.replace(tmp_path, path)
+        self.evict(keep=key)
+
+    def evict(self, keep: str | None = None):
+        entries = []
+        for p in self.path.glob("*.pck"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        evict_lru(entries, self.max_bytes, None if keep is None else self.entry_path(keep))
+
+    def clear(self):
+        for p in self.path.glob("*.pck"):
+            p.unlink(missing_ok=True)
+
+
+default_model_store = ModelStore()
+
+
+# Keeps transformed training panels, so estimators trained on the same data skip the transform.
+# Every entry is a directory with the feature matrix as .npy, loaded memory mapped, and a pickle with
+# the fitted transform and the labels. Evicts the least recently used entries past max_bytes.
+class FeatureCache:
+    def __init__(self, path: str = "feature_cache/", max_bytes: int = 8 * 1024 ** 3):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+
+    def entry_path(self, key: str) -> Path:
+        return self.path / key
+
+    def load(self, key: str) -> dict | None:
+        path = self.entry_path(key)
+        try:
+            with open(path / "meta.pck", "rb") as file:
+                entry = pickle.load(file)
+            entry['features'] = np.load(path / "features.npy", mmap_mode='r')
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError, ValueError):
+            return None
+        os.utime(path)
+        return entry
+
+    def save(self, key: str, features: np.ndarray, **meta):
+        self.path.mkdir(parents=True, exist_ok=True)
+        path = self.entry_path(key)
+        # Build the entry next to its final place and move it in, so it's never seen half written
+        tmp_path = self.path / f"{key}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir()
+        np.save(tmp_path / "features.npy", features)
+        with open(tmp_path / "meta.pck", "wb") as file:
+            pickle.dump(meta, file)
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            # Someone else saved the same entry in the meantime
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        self.evict(keep=key)
+
+    def evict(self, keep: str | None = None):
+        entries = []
+        for p in self.path.iterdir():
+            if not p.is_dir() or p.suffix == ".tmp":
+                continue
+            try:
+                size = sum(f.stat().st_size for f in p.iterdir())
+                entries.append((p.stat().st_mtime, size, p))
+            except FileNotFoundError:
+                continue
+        evict_lru(entries, self.max_bytes, None if keep is None else self.entry_path(keep))
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+default_feature_cache = FeatureCache()
+
+
+# Detections of a detector on one recording, saved as soon as the recording is done, so interrupted
+# or repeated evaluations only run what changed. Entries are a few bytes, so nothing is evicted.
+class ResultStore:
+    def __init__(self, path: str = "result_store/"):
+        self.path = Path(path)
+
+    def entry_path(self, detector_key: str, recording_key: str) -> Path:
+        return self.path / detector_key / f"{recording_key}.pck"
+
+    def load(self, detector_key: str, recording_key: str) -> list[int] | None:
+        try:
+            with open(self.entry_path(detector_key, recording_key), "rb") as file:
+                return pickle.load(file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def save(self, detector_key: str, recording_key: str, detections: list[int]):
+        path = self.entry_path(detector_key, recording_key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as file:
+            pickle.dump(detections, file)
+        os.replace(tmp_path, path)
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+default_result_store = ResultStore()
+
+
+def model_key(split_path: str, **config) -> str:
+    # The split is hashed by contents, so regenerating a split under the same name trains new models
+    with open(split_path, "rb") as file:
+        split_contents = file.read()
+    h = hashlib.md5(split_contents)
+    for name in sorted(config.keys()):
+        h.update(f"{name}={config[name]!r};".encode())
+    return h.hexdigest()
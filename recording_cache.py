@@ -0,0 +1,164 @@
+import hashlib
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from model_store import evict_lru
+from sensor_data_types import SampleBlock
+
+
+# Whether the array is a view of a memory mapped file
+def is_memory_mapped(a: np.ndarray) -> bool:
+    while isinstance(a, np.ndarray):
+        if isinstance(a, np.memmap):
+            return True
+        a = a.base
+    return False
+
+
+# Keeps calibrated recordings, so every .bin and .cal pair is only parsed and calibrated once.
+# Recently used recordings are kept in memory up to memory_max_bytes. Every recording is also saved
+# on disk as an .npy file that later loads, in any process, memory mapped. The least recently used
+# ones are evicted from disk past max_bytes. Memory mapped recordings are paged in and out by the OS,
+# so they don't count towards memory_max_bytes, only the last mapped_max_entries of them are kept open.
+# Entries are keyed by the contents of both files, so changing either one never gives stale samples.
+class RecordingCache:
+    def __init__(self, path: str = "recording_cache/", max_bytes: int = 16 * 1024 ** 3,
+                 memory_max_bytes: int = 2 * 1024 ** 3, mapped_max_entries: int = 1024):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.memory_max_bytes = memory_max_bytes
+        self.mapped_max_entries = mapped_max_entries
+        # Parsed recordings, held in memory
+        self.memory: OrderedDict[str, SampleBlock] = OrderedDict()
+        self.memory_bytes = 0
+        # Recordings memory mapped from their entries on disk
+        self.mapped: OrderedDict[str, SampleBlock] = OrderedDict()
+        # filename -> (size, mtime, md5), so unchanged files aren't hashed again
+        self.file_hashes: dict[str, tuple[int, int, str]] = {}
+
+    def entry_path(self, key: str) -> Path:
+        return self.path / f"{key}.npy"
+
+    def file_hash(self, filename: str) -> str:
+        st = os.stat(filename)
+        known = self.file_hashes.get(filename)
+        if known is not None and known[:2] == (st.st_size, st.st_mtime_ns):
+            return known[2]
+        h = hashlib.md5()
+        with open(filename, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 ** 2), b""):
+                h.update(chunk)
+        self.file_hashes[filename] = (st.st_size, st.st_mtime_ns, h.hexdigest())
+        return h.hexdigest()
+
+    def key(self, data_path: str, cal_path: str) -> str:
+        return f"{self.file_hash(data_path)}_{self.file_hash(cal_path)}"
+
+    def remember(self, key: str, block: SampleBlock):
+        if is_memory_mapped(block.data):
+            self.mapped[key] = block
+            self.mapped.move_to_end(key)
+            while len(self.mapped) > self.mapped_max_entries:
+                self.mapped.popitem(last=False)
+            return
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return
+        size = block.data.nbytes
+        if size > self.memory_max_bytes:
+            return
+        self.memory[key] = block
+        self.memory_bytes += size
+        while self.memory_bytes > self.memory_max_bytes:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= evicted.data.nbytes
+
+    # Kept recording, in memory or mapped, None if there is none
+    def recall(self, key: str) -> SampleBlock | None:
+        for kept in (self.memory, self.mapped):
+            if key in kept:
+                kept.move_to_end(key)
+                return kept[key]
+        return None
+
+    def get(self, key: str) -> SampleBlock | None:
+        block = self.recall(key)
+        if block is not None:
+            return block
+        path = self.entry_path(key)
+        try:
+            block = SampleBlock(np.load(path, mmap_mode='r'))
+        except (FileNotFoundError, ValueError):
+            return None
+        # Loading counts as a use for eviction
+        os.utime(path)
+        self.remember(key, block)
+        return block
+
+    def put(self, key: str, block: SampleBlock):
+        # Blocks are shared by everyone loading the same recording
+        block.data.flags.writeable = False
+        self.remember(key, block)
+        self.save(key, block)
+
+    def save(self, key: str, block: SampleBlock):
+        self.path.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so other processes never load a half written recording
+        tmp_path = self.path / f"{key}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            np.save(file, block.data)
+        os.replace(tmp_path, self.entry_path(key))
+        self.evict(keep=key)
+
+    def load(self, data_path: str, cal_path: str, parse: Callable[[str, str], SampleBlock]) -> SampleBlock:
+        key = self.key(data_path, cal_path)
+        block = self.get(key)
+        if block is None:
+            block = parse(data_path, cal_path)
+            self.put(key, block)
+        return block
+
+    # Like load, but returns the memory mapped entry on disk without keeping it in memory, so even
+    # recordings that would not fit can be read a part at a time
+    def open(self, data_path: str, cal_path: str, parse: Callable[[str, str], SampleBlock]) -> SampleBlock:
+        key = self.key(data_path, cal_path)
+        block = self.recall(key)
+        if block is not None:
+            return block
+        path = self.entry_path(key)
+        try:
+            os.utime(path)
+            block = SampleBlock(np.load(path, mmap_mode='r'))
+            self.remember(key, block)
+            return block
+        except (FileNotFoundError, ValueError):
+            # Not cached, or evicted by another process in the meantime
+            pass
+        block = parse(data_path, cal_path)
+        block.data.flags.writeable = False
+        self.save(key, block)
+        return block
+
+    def evict(self, keep: str | None = None):
+        entries = []
+        for p in self.path.glob("*.npy"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        evict_lru(entries, self.max_bytes, None if keep is None else self.entry_path(keep))
+
+    def clear(self):
+        self.memory.clear()
+        self.memory_bytes = 0
+        self.mapped.clear()
+        for p in self.path.glob("*.npy"):
+            p.unlink(missing_ok=True)
+
+
+default_recording_cache = RecordingCache()
@@ -0,0 +1,117 @@
+import os
+import pickle
+from pathlib import Path
+from typing import TypedDict
+
+default_recording_catalog_path = "recording_catalog.pck"
+
+
+class CatalogRecord(TypedDict):
+    data_path: str
+    calibration_path: str
+    # Where the E2ESwingMetadata labels of the recording are, or would be saved
+    detection_path: str
+
+
+class CatalogDirectory(TypedDict):
+    mtime: int
+    records: list[CatalogRecord]
+    # .bin and .cal files without their other half
+    unpaired: list[str]
+
+
+# Index of the .bin recordings in a directory, paired with their _CD.cal calibration files and
+# their .pck labels. Directories are only scanned again when their mtime changes, and labels are only
+# loaded again when their file's mtime does. The index is saved to disk, so it is shared between runs.
+class RecordingCatalog:
+    def __init__(self, path: str = default_recording_catalog_path):
+        self.path = Path(path)
+        self.directories: dict[str, CatalogDirectory] | None = None
+        # detection_path -> (mtime, impact_positions)
+        self.labels: dict[str, tuple[int, list[int]]] = {}
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as file:
+                stored = pickle.load(file)
+            self.directories, self.labels = stored['directories'], stored['labels']
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError, KeyError):
+            self.directories, self.labels = {}, {}
+
+    def save(self):
+        # Write to a temporary file first so other processes never load a half written catalog
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as file:
+            pickle.dump({'directories': self.directories, 'labels': self.labels}, file)
+        os.replace(tmp_path, self.path)
+
+    def scan(self, path_to: str, mtime: int) -> CatalogDirectory:
+        # One pass over the directory, bins and cals are paired by name
+        names = {e.name for e in os.scandir(path_to) if e.is_file()}
+        bins = sorted(n for n in names if n.endswith(".bin"))
+        cals = {n for n in names if n.endswith(".cal")}
+        records: list[CatalogRecord] = []
+        unpaired: list[str] = []
+        for b in bins:
+            common_part = b[0:-4]
+            matching_cal_name = f"{common_part}_CD.cal"
+            if matching_cal_name in cals:
+                cals.remove(matching_cal_name)
+                records.append({
+                    "data_path": f"{path_to}{b}",
+                    "calibration_path": f"{path_to}{matching_cal_name}",
+                    "detection_path": f"{path_to}{common_part}.pck"
+                })
+                if f"{common_part}.pck" in names:
+                    self.read_labels(records[-1]["detection_path"])
+            else:
+                unpaired.append(b)
+        unpaired += sorted(cals)
+        return {"mtime": mtime, "records": records, "unpaired": unpaired}
+
+    def directory(self, path_to: str) -> CatalogDirectory:
+        if self.directories is None:
+            self.load()
+        try:
+            mtime = os.stat(path_to).st_mtime_ns
+        except FileNotFoundError:
+            return {"mtime": 0, "records": [], "unpaired": []}
+        known = self.directories.get(path_to)
+        if known is None or known["mtime"] != mtime:
+            print(f"Indexing recordings in {path_to}...")
+            self.directories[path_to] = self.scan(path_to, mtime)
+            self.save()
+        return self.directories[path_to]
+
+    # path_to is the directory with a trailing /, paths in the records start with it
+    def records(self, path_to: str) -> list[CatalogRecord]:
+        return [r.copy() for r in self.directory(path_to)["records"]]
+
+    def unpaired(self, path_to: str) -> list[str]:
+        return list(self.directory(path_to)["unpaired"])
+
+    # Loads the labels at detection_path again if they changed, returns whether they did
+    def read_labels(self, detection_path: str) -> bool:
+        try:
+            mtime = os.stat(detection_path).st_mtime_ns
+        except FileNotFoundError:
+            return self.labels.pop(detection_path, None) is not None
+        known = self.labels.get(detection_path)
+        if known is not None and known[0] == mtime:
+            return False
+        with open(detection_path, "rb") as file:
+            self.labels[detection_path] = (mtime, pickle.load(file)["impact_positions"])
+        return True
+
+    # Impact positions from the E2ESwingMetadata at detection_path, none if there is no file
+    def get_labels(self, detection_path: str) -> list[int]:
+        if self.directories is None:
+            self.load()
+        if self.read_labels(detection_path):
+            self.save()
+        if detection_path not in self.labels:
+            return []
+        return list(self.labels[detection_path][1])
+
+
+default_recording_catalog = RecordingCatalog()
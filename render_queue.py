@@ -0,0 +1,67 @@
+# Renders the charts runners save of their mistakes, away from the evaluation itself.
+# Runners only cut out the samples and describe the chart, rendering happens afterwards or in a pool.
+import multiprocessing
+from typing import TypedDict
+
+import numpy as np
+from matplotlib.figure import Figure
+
+from sensor_data_types import SampleBlock
+from visualization import plot_samples
+
+
+class PlotJob(TypedDict):
+    filename: str
+    # (N x 12) samples, like SampleBlock.data
+    samples: np.ndarray
+    det_markers: list[int]
+    truth_markers: list[int]
+    title: str
+
+
+# Every process draws all of its charts on one figure
+_figure: Figure | None = None
+_axes = None
+
+
+def render_plot(job: PlotJob):
+    global _figure, _axes
+    if _figure is None:
+        # Not through pyplot, so nothing is kept around per figure and no display is needed
+        _figure = Figure(figsize=(14, 8))
+        _axes = _figure.subplots(2, 2, sharey='row')
+    else:
+        for ax in _axes.flat:
+            ax.cla()
+    plot_samples(SampleBlock(job['samples']), job['det_markers'], job['truth_markers'], in_place_axes=_axes)
+    _figure.suptitle(job['title'], fontsize=14)
+    _figure.savefig(job['filename'], dpi=100)
+
+
+def render_plots(jobs: list[PlotJob]):
+    for job in jobs:
+        render_plot(job)
+
+
+# Renders submitted charts in its own pool while the caller goes on. close() waits for all of them.
+class RenderQueue:
+    def __init__(self, processes: int = 2):
+        self.processes = processes
+        self.pool = None
+        self.pending = []
+
+    def submit(self, jobs: list[PlotJob]):
+        if len(jobs) == 0:
+            return
+        if self.pool is None:
+            self.pool = multiprocessing.get_context('spawn').Pool(processes=self.processes)
+        self.pending.append(self.pool.map_async(render_plot, jobs, chunksize=16))
+
+    def close(self):
+        for p in self.pending:
+            p.get()
+        self.pending.clear()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
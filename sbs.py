@@ -1,32 +1,16 @@
-import glob
 from typing import Callable, Any, TypedDict
 
-from matplotlib import pyplot as plt
+import numpy as np
 
-from e2e import load_raw_dataset, DetectionDataRecord, load_data
+from e2e import load_raw_dataset, DetectionDataRecord, RecordingReader
 from e2e_detectors import E2EDetector
-from visualization import plot_samples
+from recording_catalog import default_recording_catalog
+from render_queue import PlotJob, RenderQueue, render_plots
 
 
 def load_sbs_dataset(dataset: str) -> list[DetectionDataRecord]:
-    ret: list[DetectionDataRecord] = []
-    path_to = f"./sbs_dataset/{dataset}/"
-    bin_files = [x.split('/')[-1] for x in glob.glob(f"{path_to}*.bin")]
-    cal_files = [x.split('/')[-1] for x in glob.glob(f"{path_to}*.cal")]
-    for bix, b in enumerate(bin_files):
-        common_part = b[0:-4]
-        matching_cal_name = f"{common_part}_CD.cal"
-        for idx, c in enumerate(cal_files):
-            if c == matching_cal_name:
-                ret.append({
-                    "data_path": f"{path_to}{b}",
-                    "calibration_path": f"{path_to}{c}",
-                    "detection_path": None
-                })
-                bin_files[bix] = "USED UP NAME"
-                cal_files[idx] = "USED UP NAME"
-                break
-    return ret
+    # Side by side recordings aren't labelled
+    return [{**r, "detection_path": None} for r in default_recording_catalog.records(f"./sbs_dataset/{dataset}/")]
 
 
 # Types of dissimilarity
@@ -79,7 +63,9 @@ class SBSRunner:
                  detector_1_builder: Callable[[Any], E2EDetector],
                  detector_1_args: dict,
                  detector_2_builder: Callable[[Any], E2EDetector],
-                 detector_2_args: dict):
+                 detector_2_args: dict,
+                 plots: bool = True,
+                 max_plots: int | None = None):
         main_dataset = load_sbs_dataset(dataset)
         # main_e2e_dataset = load_raw_dataset(dataset)
         # not_dataset = load_raw_dataset("not")
@@ -91,8 +77,12 @@ class SBSRunner:
         self.detector_2_builder = detector_2_builder
         self.detector_1_args = detector_1_args
         self.detector_2_args = detector_2_args
+        # Whether to save charts of discrepancies, and at most how many per run
+        self.plots = plots
+        self.max_plots = max_plots
 
-    def run(self) -> SBSRunnerResult:
+    # Charts are rendered in render_queue after the run, or here if there is none
+    def run(self, render_queue: RenderQueue | None = None) -> SBSRunnerResult:
         db1 = lambda a=self.detector_1_args: self.detector_1_builder(**a)
         db2 = lambda a=self.detector_2_args: self.detector_2_builder(**a)
 
@@ -103,6 +93,7 @@ class SBSRunner:
             record_results=[]
         )
 
+        plot_jobs: list[PlotJob] = []
         records = self.dataset
         for idx, rdr in enumerate(records):
             filehash = (rdr["data_path"].split('/')[-1]).split('_')[0]
@@ -119,25 +110,29 @@ class SBSRunner:
                 has_misaligned=False
             )
 
-            samples = load_data(rdr["data_path"], rdr["calibration_path"])
-            for sample in samples:
-                r1 = d1.add_sample(sample)
-                r2 = d2.add_sample(sample)
-
-                min_allowed = 200
-                max_allowed = len(samples) - 200
-
-                if r1 is not None:
-                    # Since ROCKET detector can have issues triggering at the very edges
-                    # Ignore edge detections for both of them to ensure fairness
-                    if r1 > min_allowed and r1 < max_allowed:
-                        res['detector1'].append(r1)
-
-                if r2 is not None:
-                    # Since ROCKET detector can have issues triggering at the very edges
-                    # Ignore edge detections for both of them to ensure fairness
-                    if r2 > min_allowed and r2 < max_allowed:
-                        res['detector2'].append(r2)
+            recording = RecordingReader(rdr["data_path"], rdr["calibration_path"])
+            min_allowed = 200
+            max_allowed = len(recording) - 200
+            for block in recording.blocks():
+                for sample in block:
+                    r1 = d1.add_sample(sample)
+                    r2 = d2.add_sample(sample)
+
+                    if r1 is not None:
+                        # Since ROCKET detector can have issues triggering at the very edges
+                        # Ignore edge detections for both of them to ensure fairness
+                        if r1 > min_allowed and r1 < max_allowed:
+                            res['detector1'].append(r1)
+
+                    if r2 is not None:
+                        # Since ROCKET detector can have issues triggering at the very edges
+                        # Ignore edge detections for both of them to ensure fairness
+                        if r2 > min_allowed and r2 < max_allowed:
+                            res['detector2'].append(r2)
+
+            # Detectors that batch their classification can still be holding detections at the end
+            res['detector1'] += [r for r in d1.finish() if min_allowed < r < max_allowed]
+            res['detector2'] += [r for r in d2.finish() if min_allowed < r < max_allowed]
 
             # Check for additional
             if len(res['detector1']) > len(res['detector2']):
@@ -158,8 +153,8 @@ class SBSRunner:
                 if res['has_misaligned']:
                     break
 
-            if res['detector1_has_additional'] or res['detector2_has_additional'] or res['has_misaligned']:
-                print("Saving chart...")
+            has_discrepancy = res['detector1_has_additional'] or res['detector2_has_additional'] or res['has_misaligned']
+            if has_discrepancy and self.plots and (self.max_plots is None or len(plot_jobs) < self.max_plots):
                 # Save charts on discrepancies
                 # Chart should cover area between all detections
                 all_detections = res['detector1'] + res['detector2']
@@ -168,8 +163,8 @@ class SBSRunner:
                 end_idx = all_detections[-1] + 100
                 if start_idx < 0:
                     start_idx = 0
-                if end_idx >= len(samples):
-                    end_idx = len(samples) - 1
+                if end_idx >= len(recording):
+                    end_idx = len(recording) - 1
 
                 d1_markers = res['detector1'].copy()
                 d2_markers = res['detector2'].copy()
@@ -178,13 +173,20 @@ class SBSRunner:
                 for i in range(len(d2_markers)):
                     d2_markers[i] -= start_idx
 
-                fig, ax = plot_samples(samples[start_idx:end_idx], d1_markers, d2_markers)
                 ds = rdr["data_path"].split('/')[-2]
-                fig.suptitle(f"{ds} {filehash} D1A:{res['detector1_has_additional']} D2A:{res['detector2_has_additional']} MIS:{res['has_misaligned']}", fontsize=14)
-                fig.savefig(f"DIS-{self.name}-{filehash}.png", dpi=100)
-                plt.close(fig)
+                plot_jobs.append(PlotJob(
+                    filename=f"DIS-{self.name}-{filehash}.png",
+                    samples=np.array(recording.read(start_idx, end_idx).data),
+                    det_markers=d1_markers,
+                    truth_markers=d2_markers,
+                    title=f"{ds} {filehash} D1A:{res['detector1_has_additional']} D2A:{res['detector2_has_additional']} MIS:{res['has_misaligned']}"
+                ))
 
             print(f"Finished {idx}/{len(records)} {filehash} with {res}")
             final_result['record_results'].append(res)
 
+        if render_queue is None:
+            render_plots(plot_jobs)
+        else:
+            render_queue.submit(plot_jobs)
         return final_result
\ No newline at end of file
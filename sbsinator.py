@@ -2,6 +2,7 @@ import csv
 
 from e2e_detectors import E2EDetector, E2ERocketFullSwingPrime, E2EMinigolf, E2ERocketPuttingPrime
 from minigolf import MinigolfDetector
+from render_queue import RenderQueue
 from sbs import SBSRunner, get_d1_additonal_rate, get_d2_additonal_rate, get_misaligned_rate, SBSRunnerResult
 from sensor_data_types import DominantHand, WornHand
 from swing_data_instance import ArmGyroNormSynth, PalmGyroNormSynth
@@ -92,9 +93,11 @@ if __name__ == "__main__":
             detector_2_args={}
         ))
 
+    # Charts of one runner are rendered while the next one runs
+    render_queue = RenderQueue()
     for idx, r in enumerate(runners):
         print(f"--- RUNNING {r.name} {idx}/{len(runners)}---")
-        result = r.run()
+        result = r.run(render_queue)
         print("Saving results...")
         save_results(csv_writer, idx, r, result)
 
@@ -102,3 +105,5 @@ if __name__ == "__main__":
         print(f"1. detektoram vairāk par 2. - {get_d1_additonal_rate(result) * 100:.1f}%")
         print(f"2. detektoram vairāk par 1. - {get_d2_additonal_rate(result) * 100:.1f}%")
         print(f"Nesakrīt pozīcijas - {get_misaligned_rate(result) * 100:.1f}%")
+
+    render_queue.close()
@@ -1,4 +1,5 @@
-from typing import Any, TypeAlias, TypedDict
+from typing import Any, Iterator, TypeAlias, TypedDict
+import numpy as np
 import pandas as pd
 import enum
 
@@ -12,6 +13,137 @@ class WristSample(TypedDict):
     arm_acc: ThreeAxis
 
 
+# Column layout of a SampleBlock, same order as the dimensions of SwingDataInstance
+SAMPLE_CHANNELS: list[str] = [
+    "arm_gyro_x", "arm_gyro_y", "arm_gyro_z",
+    "arm_acc_x", "arm_acc_y", "arm_acc_z",
+    "palm_gyro_x", "palm_gyro_y", "palm_gyro_z",
+    "palm_acc_x", "palm_acc_y", "palm_acc_z"
+]
+ARM_GYRO = slice(0, 3)
+ARM_ACC = slice(3, 6)
+PALM_GYRO = slice(6, 9)
+PALM_ACC = slice(9, 12)
+
+_iter_chunk_size = 4096
+
+
+def _row2wristSample(r) -> WristSample:
+    return WristSample(
+        arm_gyro=(r[0], r[1], r[2]),
+        arm_acc=(r[3], r[4], r[5]),
+        palm_gyro=(r[6], r[7], r[8]),
+        palm_acc=(r[9], r[10], r[11])
+    )
+
+
+class SampleBlock:
+    # Struct-of-arrays replacement for list[WristSample], one (N x 12) float64 array.
+    # Slicing returns views, so cropping a recording or a window costs nothing.
+    def __init__(self, data: np.ndarray | None = None):
+        if data is None:
+            data = np.empty((0, len(SAMPLE_CHANNELS)), dtype='float64')
+        data = np.asarray(data, dtype='float64')
+        if data.ndim != 2 or data.shape[1] != len(SAMPLE_CHANNELS):
+            raise ValueError(f"SampleBlock needs an (N, {len(SAMPLE_CHANNELS)}) array, got {data.shape}")
+        self.data = data
+
+    @classmethod
+    def from_wrist_samples(cls, samples: list[WristSample]) -> "SampleBlock":
+        data = np.array([(*s['arm_gyro'], *s['arm_acc'], *s['palm_gyro'], *s['palm_acc']) for s in samples],
+                        dtype='float64')
+        return cls(data.reshape(-1, len(SAMPLE_CHANNELS)))
+
+    @classmethod
+    def concatenate(cls, blocks: list["SampleBlock"]) -> "SampleBlock":
+        if len(blocks) == 0:
+            return cls()
+        return cls(np.concatenate([b.data for b in blocks], axis=0))
+
+    def to_wrist_samples(self) -> list[WristSample]:
+        return [_row2wristSample(r) for r in self.data.tolist()]
+
+    def channel(self, name: str) -> np.ndarray:
+        return self.data[:, SAMPLE_CHANNELS.index(name)]
+
+    @property
+    def arm_gyro(self) -> np.ndarray:
+        return self.data[:, ARM_GYRO]
+
+    @property
+    def arm_acc(self) -> np.ndarray:
+        return self.data[:, ARM_ACC]
+
+    @property
+    def palm_gyro(self) -> np.ndarray:
+        return self.data[:, PALM_GYRO]
+
+    @property
+    def palm_acc(self) -> np.ndarray:
+        return self.data[:, PALM_ACC]
+
+    def __len__(self) -> int:
+        return self.data.shape[0]
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return _row2wristSample(self.data[key].tolist())
+        return SampleBlock(self.data[key])
+
+    def __iter__(self) -> Iterator[WristSample]:
+        # Only materialize a chunk of the recording as Python objects at once
+        for start in range(0, len(self), _iter_chunk_size):
+            for r in self.data[start:start + _iter_chunk_size].tolist():
+                yield _row2wristSample(r)
+
+    def __repr__(self) -> str:
+        return f"SampleBlock({len(self)} samples)"
+
+
+class SampleRingBuffer:
+    # Keeps the last `capacity` samples contiguous in memory. Samples are written into an array twice the
+    # size and the newest ones are moved back to the start when it fills up, so any window over
+    # the buffer is a view and copying only happens when the array wraps.
+    # With `history` the buffer can also return windows as they were up to `history` samples ago.
+    # Windows are overwritten by later samples, copy them if they need to be kept.
+    def __init__(self, capacity: int, history: int = 0):
+        self.capacity = capacity
+        self.history = history
+        self.data = np.empty(((capacity + history) * 2, len(SAMPLE_CHANNELS)), dtype='float64')
+        self.end = 0
+        self.stored = 0
+
+    def append(self, sample: WristSample):
+        kept = self.capacity + self.history
+        if self.end == len(self.data):
+            self.data[:kept - 1] = self.data[self.end - kept + 1:self.end]
+            self.end = kept - 1
+        self.data[self.end] = (*sample['arm_gyro'], *sample['arm_acc'], *sample['palm_gyro'], *sample['palm_acc'])
+        self.end += 1
+        if self.stored < kept:
+            self.stored += 1
+
+    def length(self, lag: int = 0) -> int:
+        return max(0, min(self.stored - lag, self.capacity))
+
+    def __len__(self) -> int:
+        return self.length()
+
+    def window(self, crop: slice | None = None, lag: int = 0) -> SampleBlock:
+        # Oldest sample first, crop is applied the same way as on a list of the buffered samples
+        end = self.end - lag
+        w = self.data[end - self.length(lag):end]
+        if crop is not None:
+            w = w[crop]
+        return SampleBlock(w)
+
+
+def wristSample2sampleBlock(samples: list[WristSample] | SampleBlock) -> SampleBlock:
+    if isinstance(samples, SampleBlock):
+        return samples
+    return SampleBlock.from_wrist_samples(samples)
+
+
 class CalibrationData(TypedDict):
     palm_z: Any
     palm_mount: Any
@@ -53,7 +185,7 @@ class SwingDataInstance(TypedDict):
     class_id: int  # For class descriptions see class_ids.txt
 
 
-def wristSample2swingDataInstance(samples: list[WristSample],
+def wristSample2swingDataInstance(samples: list[WristSample] | SampleBlock,
                                   swingType: SwingType,
                                   dominantHand: DominantHand,
                                   wornHand: WornHand) -> SwingDataInstance:
@@ -66,18 +198,9 @@ def wristSample2swingDataInstance(samples: list[WristSample],
     else:
         instance["class_id"] = 1 + dominantHand.value + (wornHand.value*2) + (swingType.value*4)
     print(f"Created SDI metadata: {instance}")
-    instance["arm_gyro_x"] = pd.Series(data=[x["arm_gyro"][0] for x in samples])
-    instance["arm_gyro_y"] = pd.Series(data=[x["arm_gyro"][1] for x in samples])
-    instance["arm_gyro_z"] = pd.Series(data=[x["arm_gyro"][2] for x in samples])
-    instance["arm_acc_x"] = pd.Series(data=[x["arm_acc"][0] for x in samples])
-    instance["arm_acc_y"] = pd.Series(data=[x["arm_acc"][1] for x in samples])
-    instance["arm_acc_z"] = pd.Series(data=[x["arm_acc"][2] for x in samples])
-    instance["palm_gyro_x"] = pd.Series(data=[x["palm_gyro"][0] for x in samples])
-    instance["palm_gyro_y"] = pd.Series(data=[x["palm_gyro"][1] for x in samples])
-    instance["palm_gyro_z"] = pd.Series(data=[x["palm_gyro"][2] for x in samples])
-    instance["palm_acc_x"] = pd.Series(data=[x["palm_acc"][0] for x in samples])
-    instance["palm_acc_y"] = pd.Series(data=[x["palm_acc"][1] for x in samples])
-    instance["palm_acc_z"] = pd.Series(data=[x["palm_acc"][2] for x in samples])
+    block = wristSample2sampleBlock(samples)
+    for idx, name in enumerate(SAMPLE_CHANNELS):
+        instance[name] = pd.Series(data=block.data[:, idx].copy())
     return instance
 
 def swingDataInstance2wristSample(sdi: SwingDataInstance):
@@ -92,19 +215,13 @@ def swingDataInstance2wristSample(sdi: SwingDataInstance):
     return samples
 
 
-def wristSample2sktimeData(samples: list[WristSample]) -> pd.DataFrame:
-    data = {
-        "arm_gyro_x": [pd.Series(data=[x["arm_gyro"][0] for x in samples], dtype='float64')],
-        "arm_gyro_y": [pd.Series(data=[x["arm_gyro"][1] for x in samples], dtype='float64')],
-        "arm_gyro_z": [pd.Series(data=[x["arm_gyro"][2] for x in samples], dtype='float64')],
-        "arm_acc_x": [pd.Series(data=[x["arm_acc"][0] for x in samples], dtype='float64')],
-        "arm_acc_y": [pd.Series(data=[x["arm_acc"][1] for x in samples], dtype='float64')],
-        "arm_acc_z": [pd.Series(data=[x["arm_acc"][2] for x in samples], dtype='float64')],
-        "palm_gyro_x": [pd.Series(data=[x["palm_gyro"][0] for x in samples], dtype='float64')],
-        "palm_gyro_y": [pd.Series(data=[x["palm_gyro"][1] for x in samples], dtype='float64')],
-        "palm_gyro_z": [pd.Series(data=[x["palm_gyro"][2] for x in samples], dtype='float64')],
-        "palm_acc_x": [pd.Series(data=[x["palm_acc"][0] for x in samples], dtype='float64')],
-        "palm_acc_y": [pd.Series(data=[x["palm_acc"][1] for x in samples], dtype='float64')],
-        "palm_acc_z": [pd.Series(data=[x["palm_acc"][2] for x in samples], dtype='float64')]
-    }
+# Windows of equal length to a (instances, channels, length) array, as sktime takes it
+def wristSample2panel(windows: list[list[WristSample] | SampleBlock]) -> np.ndarray:
+    return np.stack([wristSample2sampleBlock(w).data.T for w in windows])
+
+
+def wristSample2sktimeData(samples: list[WristSample] | SampleBlock) -> pd.DataFrame:
+    block = wristSample2sampleBlock(samples)
+    data = {name: [pd.Series(data=block.data[:, idx].copy(), dtype='float64')]
+            for idx, name in enumerate(SAMPLE_CHANNELS)}
     return pd.DataFrame(data)
@@ -0,0 +1,129 @@
+# SQLite catalog of the labelled snippets in dataset/, kept up to date by sdi_save, sdi_delete and sdi_deactivate.
+# Lets split generation and dataset queries look snippets up by label instead of walking directories.
+import pickle
+import sqlite3
+from pathlib import Path
+
+from sensor_data_types import *
+from snippet_pack import snippet_hash
+
+default_catalog_path = "dataset/catalog.sqlite"
+
+
+def _enum_value(e) -> int | None:
+    return None if e is None else e.value
+
+
+class SnippetCatalog:
+    def __init__(self, path: str = default_catalog_path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS snippets (
+                               hash TEXT PRIMARY KEY,
+                               path TEXT NOT NULL,
+                               category TEXT NOT NULL,
+                               class_id INTEGER NOT NULL,
+                               swing_type INTEGER,
+                               dominant_hand INTEGER,
+                               worn_hand INTEGER,
+                               source TEXT,
+                               impact INTEGER,
+                               length INTEGER,
+                               packed INTEGER)""")
+        # Catalogs made before snippet lengths were kept
+        columns = [r[1] for r in self.db.execute("PRAGMA table_info(snippets)")]
+        if "length" not in columns:
+            self.db.execute("ALTER TABLE snippets ADD COLUMN length INTEGER")
+            self.db.execute("ALTER TABLE snippets ADD COLUMN packed INTEGER")
+        self.db.execute("CREATE INDEX IF NOT EXISTS snippets_category ON snippets (category)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS snippets_class_id ON snippets (class_id)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS snippets_source ON snippets (source)")
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM snippets").fetchone()[0]
+
+    # category is the dataset/ subdirectory the snippet is in, like "fs_right_off" or "not"
+    # packed is whether the snippet is in the pack, None if that isn't known
+    def add(self, path: str, h: str, category: str, sdi: SwingDataInstance,
+            source: str | None = None, impact: int | None = None, packed: bool | None = None,
+            commit: bool = True):
+        self.db.execute("INSERT OR REPLACE INTO snippets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (h, path, category, sdi['class_id'], _enum_value(sdi['swing_type']),
+                         _enum_value(sdi['dominant_hand']), _enum_value(sdi['worn_hand']), source, impact,
+                         len(sdi['arm_gyro_x']), packed))
+        if commit:
+            self.db.commit()
+
+    def remove(self, h: str):
+        self.db.execute("DELETE FROM snippets WHERE hash = ?", (h,))
+        self.db.commit()
+
+    # Paths in the order the snippets were added. Files that were moved or deleted without going
+    # through sdi_delete or sdi_deactivate are left out.
+    def files(self, category: str | None = None, class_id: int | None = None) -> list[str]:
+        query = "SELECT path FROM snippets WHERE 1"
+        args = []
+        if category is not None:
+            query += " AND category = ?"
+            args.append(category)
+        if class_id is not None:
+            query += " AND class_id = ?"
+            args.append(class_id)
+        return [r[0] for r in self.db.execute(query + " ORDER BY rowid", args) if Path(r[0]).exists()]
+
+    def files_from(self, source: str) -> list[str]:
+        return [r[0] for r in self.db.execute("SELECT path FROM snippets WHERE source = ? ORDER BY impact",
+                                              (source,))]
+
+    def classes(self, hashes: list[str]) -> dict[str, int]:
+        found = {}
+        # Stay below SQLite's limit on query parameters
+        for start in range(0, len(hashes), 500):
+            batch = hashes[start:start + 500]
+            query = f"SELECT hash, class_id FROM snippets WHERE hash IN ({', '.join('?' for _ in batch)})"
+            found.update(self.db.execute(query, batch))
+        return found
+
+    def categories(self) -> dict[str, int]:
+        return dict(self.db.execute("SELECT category, COUNT(*) FROM snippets GROUP BY category"))
+
+
+# Adds every snippet in the dataset/ tree that isn't in the catalog yet and drops the ones whose file is gone.
+# Source recording and impact of added snippets are not known anymore, so those are left empty.
+def rebuild_catalog(catalog: SnippetCatalog, dataset_path: str = "dataset/"):
+    known = set()
+    for h, path in catalog.db.execute("SELECT hash, path FROM snippets").fetchall():
+        if Path(path).exists():
+            known.add(h)
+        else:
+            catalog.db.execute("DELETE FROM snippets WHERE hash = ?", (h,))
+    added = 0
+    for p in sorted(Path(dataset_path).rglob('*.pck')):
+        h = snippet_hash(str(p))
+        if h in known:
+            continue
+        sdi = pickle.load(open(p, 'rb'))
+        catalog.add(str(p), h, p.parent.name, sdi, commit=False)
+        added += 1
+    catalog.db.commit()
+    print(f"Added {added} snippets to the catalog")
+
+
+def open_catalog(path: str = default_catalog_path, dataset_path: str = "dataset/") -> SnippetCatalog:
+    exists = Path(path).exists()
+    catalog = SnippetCatalog(path)
+    if not exists:
+        # First use, index what is already there
+        rebuild_catalog(catalog, dataset_path)
+    return catalog
+
+
+if __name__ == "__main__":
+    c = open_catalog()
+    rebuild_catalog(c)
+    for category, count in sorted(c.categories().items()):
+        print(f"{category}: {count}")
@@ -0,0 +1,200 @@
+# Packed snippet dataset. All snippets are kept in one contiguous float64 file of shape
+# (snippets, channels, length), read with memory mapping, next to a small index of their labels.
+# Both files are only ever appended to, so new labels can be added without rewriting the pack.
+import collections
+import os
+import pickle
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from sensor_data_types import *
+
+default_pack_path = "dataset_packed/"
+
+PACK_INDEX_DTYPE = np.dtype([
+    ('hash', 'S32'),
+    ('class_id', 'i2'),
+    # Enum values, -1 for None
+    ('swing_type', 'i1'),
+    ('dominant_hand', 'i1'),
+    ('worn_hand', 'i1'),
+    ('removed', '?'),
+    ('length', 'i4')
+])
+
+
+# Snippet files are named <class dir>_<md5 of the pickle>.pck
+def snippet_hash(filename: str) -> str:
+    return Path(filename).stem.split('_')[-1]
+
+
+def _enum_value(e) -> int:
+    return -1 if e is None else e.value
+
+
+class SnippetPack:
+    def __init__(self, path: str = default_pack_path):
+        self.path = Path(path)
+        self.index_path = self.path / "index.bin"
+        self.samples_path = self.path / "samples.f64"
+        self.reload()
+
+    def reload(self):
+        if self.index_path.exists():
+            self.index = np.fromfile(self.index_path, dtype=PACK_INDEX_DTYPE)
+        else:
+            self.index = np.empty(0, dtype=PACK_INDEX_DTYPE)
+        self.rows: dict[str, int] = {}
+        for row, (h, removed) in enumerate(zip(self.index['hash'], self.index['removed'])):
+            if not removed:
+                self.rows[h.decode()] = row
+        self._samples = None
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def snippet_length(self) -> int | None:
+        return int(self.index['length'][0]) if len(self.index) > 0 else None
+
+    # Whether the snippet is as long as the ones already packed
+    def fits(self, sdi: SwingDataInstance) -> bool:
+        length = self.snippet_length()
+        return length is None or len(sdi['arm_gyro_x']) == length
+
+    # Memory mapped (snippets, channels, length) array, only the rows that are indexed
+    def samples(self) -> np.ndarray:
+        if self._samples is None:
+            length = self.snippet_length()
+            if length is None:
+                return np.empty((0, len(SAMPLE_CHANNELS), 0), dtype='float64')
+            self._samples = np.memmap(self.samples_path, dtype='float64', mode='r',
+                                      shape=(len(self.index), len(SAMPLE_CHANNELS), length))
+        return self._samples
+
+    # Rows of the given snippets, None if any of them is not in the pack
+    def find(self, hashes: list[str]) -> np.ndarray | None:
+        try:
+            return np.array([self.rows[h] for h in hashes], dtype='int64')
+        except KeyError:
+            return None
+
+    def classes(self, rows: np.ndarray) -> list[int]:
+        return self.index['class_id'][rows].astype('int64').tolist()
+
+    # Only the given channels (indexes into SAMPLE_CHANNELS) and samples are read
+    def load(self, rows: np.ndarray, channels: list[int] | None = None,
+             crop: slice | None = None) -> (np.ndarray, list[int]):
+        if channels is None:
+            channels = list(range(len(SAMPLE_CHANNELS)))
+        if crop is None:
+            crop = slice(None)
+        # Read in file order, then put back in the requested order
+        order = np.argsort(rows, kind='stable')
+        data = self.samples()[rows[order][:, None], np.asarray(channels, dtype='int64')[None, :], crop]
+        panel = np.empty(data.shape, dtype='float64')
+        panel[order] = data
+        return panel, self.classes(rows)
+
+    def append(self, sdis: list[SwingDataInstance], hashes: list[str]):
+        if len(sdis) == 0:
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        panel = np.array([[np.asarray(sdi[name], dtype='float64') for name in SAMPLE_CHANNELS] for sdi in sdis],
+                         dtype='float64')
+        length = self.snippet_length()
+        if panel.ndim != 3 or (length is not None and panel.shape[2] != length):
+            raise ValueError(f"All snippets in a pack must be {length} samples long")
+
+        records = np.empty(len(sdis), dtype=PACK_INDEX_DTYPE)
+        for i, (sdi, h) in enumerate(zip(sdis, hashes)):
+            records[i] = (h.encode(), sdi['class_id'], _enum_value(sdi['swing_type']),
+                          _enum_value(sdi['dominant_hand']), _enum_value(sdi['worn_hand']), False, panel.shape[2])
+
+        # Samples go first, so an index entry never points past the end of the samples
+        with open(self.samples_path, "ab") as file:
+            file.write(panel.tobytes())
+        with open(self.index_path, "ab") as file:
+            file.write(records.tobytes())
+        self.reload()
+
+    def remove(self, h: str):
+        if h not in self.rows:
+            return
+        index = np.memmap(self.index_path, dtype=PACK_INDEX_DTYPE, mode='r+')
+        index['removed'][self.rows[h]] = True
+        index.flush()
+        del index
+        self.reload()
+
+
+def open_pack(path: str = default_pack_path) -> SnippetPack | None:
+    if not (Path(path) / "index.bin").exists():
+        return None
+    return SnippetPack(path)
+
+
+def _load_snippet(filename: str) -> SwingDataInstance:
+    with open(filename, 'rb') as file:
+        return pickle.load(file)
+
+
+# One-shot conversion of the dataset/ tree of pickled snippets to a pack.
+# Snippets of another length than the pack's, like whole recordings, are left out and listed. An empty pack
+# takes the length most of the snippets have. The pack is built next to pack_path and only moved in place
+# once all batches are written, so a failed conversion leaves the previous pack as it was.
+def convert_dataset(dataset_path: str = "dataset/", pack_path: str = default_pack_path,
+                    batch_size: int = 1000) -> SnippetPack:
+    pack = SnippetPack(pack_path)
+    files = sorted(str(p) for p in Path(dataset_path).rglob('*.pck'))
+    files = [f for f in files if snippet_hash(f) not in pack.rows]
+
+    length = pack.snippet_length()
+    if length is None and len(files) > 0:
+        lengths = collections.Counter(len(_load_snippet(f)['arm_gyro_x']) for f in files)
+        length = lengths.most_common(1)[0][0]
+
+    temp_path = pack.path.with_name(pack.path.name + ".tmp")
+    shutil.rmtree(temp_path, ignore_errors=True)
+    temp_path.mkdir(parents=True)
+    try:
+        for existing in [pack.samples_path, pack.index_path]:
+            if existing.exists():
+                shutil.copyfile(existing, temp_path / existing.name)
+        temp_pack = SnippetPack(temp_path)
+
+        print(f"Packing {len(files)} snippets of length {length} into {pack_path}...")
+        skipped = []
+        for start in range(0, len(files), batch_size):
+            batch = files[start:start + batch_size]
+            sdis = []
+            hashes = []
+            for f in batch:
+                sdi = _load_snippet(f)
+                if len(sdi['arm_gyro_x']) != length:
+                    skipped.append(f)
+                    continue
+                sdis.append(sdi)
+                hashes.append(snippet_hash(f))
+            temp_pack.append(sdis, hashes)
+            print(f"Packed {start + len(batch)}/{len(files)}")
+        if len(skipped) > 0:
+            print(f"Left out {len(skipped)} snippets that are not {length} samples long:")
+            for f in skipped:
+                print(f"  {f}")
+
+        # Samples go first, so the index in place never points past the end of the samples
+        pack.path.mkdir(parents=True, exist_ok=True)
+        for moved in [temp_pack.samples_path, temp_pack.index_path]:
+            if moved.exists():
+                os.replace(moved, pack.path / moved.name)
+    finally:
+        shutil.rmtree(temp_path, ignore_errors=True)
+    pack.reload()
+    return pack
+
+
+if __name__ == "__main__":
+    p = convert_dataset()
+    print(f"Pack has {len(p)} snippets of length {p.snippet_length()}")
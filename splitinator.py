@@ -3,7 +3,7 @@ import multiprocessing
 
 from e2e_detectors import E2ERocketFullSwingPrime, E2ERocketPuttingPrime, E2EDetector, E2ERocketFullSwingIsolation, \
     E2ERocketPuttingIsolation, E2EMinigolf, E2EThreshold
-from e2e_runner import E2ERunner, save_results, execute_runner
+from e2e_runner import E2ERunner, save_results, execute_runners
 from minigolf import MinigolfDetector
 from sensor_data_types import DominantHand, WornHand
 from swing_data_instance import ArmGyroNormSynth, PalmGyroNormSynth, PalmAccDifSynth
@@ -65,7 +65,9 @@ def get_full_swing_minigolf() -> E2EDetector:
         name=nx,
         dominantHand=DominantHand.RIGHT,
         wornHand=WornHand.OFFHAND,
-        detector=MinigolfDetector.FULLSWING
+        detector=MinigolfDetector.FULLSWING,
+        # Only the detections at the end of each recording are needed
+        lookahead=None
     )
 
 
@@ -75,7 +77,8 @@ def get_putting_minigolf() -> E2EDetector:
         name=nx,
         dominantHand=DominantHand.RIGHT,
         wornHand=WornHand.OFFHAND,
-        detector=MinigolfDetector.PUTTING
+        detector=MinigolfDetector.PUTTING,
+        lookahead=None
     )
 
 
@@ -157,8 +160,7 @@ if __name__ == "__main__":
     pool = ctx.Pool(processes=4)
 
     # Palaist eksperimentus
-    processes = [pool.apply_async(execute_runner, args=(id, r,)) for id, r in enumerate(runners)]
-    results = [p.get() for p in processes]
+    results = execute_runners(pool, runners)
 
     for r in results:
         save_results(csv_writer, r[0], r[1], r[2])
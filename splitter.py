@@ -1,8 +1,8 @@
 import random
 from typing import TypedDict
-from pathlib import Path
 import pickle
 import hashlib
+from snippet_catalog import open_catalog
 
 
 class DataSplit(TypedDict):
@@ -28,34 +28,17 @@ def test_split(l: list, test_fraction: float) -> list:
 def generate_split(test_fraction: float = 0.95) -> str:
     print(f"Generating split for all data with test_fraction {test_fraction:.3f}")
 
-    not_files: list[str] = []
-    fs_right_off: list[str] = []
-    fs_right_dm: list[str] = []
-    fs_left_off: list[str] = []
-    fs_left_dm: list[str] = []
-    put_right_off: list[str] = []
-    put_right_dm: list[str] = []
-    put_left_off: list[str] = []
-    put_left_dm: list[str] = []
-
-    for path in Path('dataset/not').rglob('*.pck'):
-        not_files.append(str(path))
-    for path in Path('dataset/fs_right_off').rglob('*.pck'):
-        fs_right_off.append(str(path))
-    for path in Path('dataset/fs_right_dm').rglob('*.pck'):
-        fs_right_dm.append(str(path))
-    for path in Path('dataset/fs_left_off').rglob('*.pck'):
-        fs_left_off.append(str(path))
-    for path in Path('dataset/fs_left_dm').rglob('*.pck'):
-        fs_left_dm.append(str(path))
-    for path in Path('dataset/put_right_off').rglob('*.pck'):
-        put_right_off.append(str(path))
-    for path in Path('dataset/put_right_dm').rglob('*.pck'):
-        put_right_dm.append(str(path))
-    for path in Path('dataset/put_left_off').rglob('*.pck'):
-        put_left_off.append(str(path))
-    for path in Path('dataset/put_left_dm').rglob('*.pck'):
-        put_left_dm.append(str(path))
+    catalog = open_catalog()
+    not_files: list[str] = catalog.files('not')
+    fs_right_off: list[str] = catalog.files('fs_right_off')
+    fs_right_dm: list[str] = catalog.files('fs_right_dm')
+    fs_left_off: list[str] = catalog.files('fs_left_off')
+    fs_left_dm: list[str] = catalog.files('fs_left_dm')
+    put_right_off: list[str] = catalog.files('put_right_off')
+    put_right_dm: list[str] = catalog.files('put_right_dm')
+    put_left_off: list[str] = catalog.files('put_left_off')
+    put_left_dm: list[str] = catalog.files('put_left_dm')
+    catalog.close()
 
     random.shuffle(not_files)
     random.shuffle(fs_right_off)
@@ -1,7 +1,7 @@
 import pickle
 import sys
-from pathlib import Path
 from splitter import DataSplit
+from snippet_catalog import open_catalog
 import random
 
 
@@ -21,16 +21,11 @@ def max_split(l: list, max_items: int) -> list:
 
 
 def generate_split(max_items: int) -> DataSplit:
-    not_files: list[str] = []
-    fs_right_off: list[str] = []
-    put_right_off: list[str] = []
-
-    for path in Path('dataset/not').rglob('*.pck'):
-        not_files.append(str(path))
-    for path in Path('dataset/fs_right_off').rglob('*.pck'):
-        fs_right_off.append(str(path))
-    for path in Path('dataset/put_right_off').rglob('*.pck'):
-        put_right_off.append(str(path))
+    catalog = open_catalog()
+    not_files: list[str] = catalog.files('not')
+    fs_right_off: list[str] = catalog.files('fs_right_off')
+    put_right_off: list[str] = catalog.files('put_right_off')
+    catalog.close()
 
     test_files = []
     train_files = []
@@ -0,0 +1,73 @@
+# Declarative parameter sweeps over E2ERunners.
+# A sweep varies one parameter at a time from the builders' defaults, for every combination of the
+# grid, like "every crop for every split". Configurations that come out the same, like a swept value
+# that is also the default, run once and their results are reported under every name they were given.
+from typing import Any, Callable, TypedDict
+
+from e2e import E2ERunnerResult
+from e2e_detectors import E2EDetector
+from e2e_runner import E2ERunner, execute_runners
+
+
+class SweepAxis(TypedDict):
+    # Configurations are named "<title> <label> (<grid label>)"
+    title: str
+    # Labels and the builder arguments they set
+    values: list[tuple[str, dict[str, Any]]]
+
+
+class SweepTarget(TypedDict):
+    dataset: str
+    builder: Callable[[Any], E2EDetector]
+
+
+def grid_product(grid: list[list[tuple[str, dict[str, Any]]]]) -> list[tuple[str, dict[str, Any]]]:
+    combinations = [("", {})]
+    for parameter in grid:
+        combinations = [(f"{label} {value_label}".strip(), {**args, **value_args})
+                        for label, args in combinations for value_label, value_args in parameter]
+    return combinations
+
+
+def sweep_runners(targets: list[SweepTarget], axes: list[SweepAxis],
+                  grid: list[list[tuple[str, dict[str, Any]]]] = [],
+                  impact_dilation: int = 7, plots: bool = True,
+                  max_plots: int | None = None) -> list[E2ERunner]:
+    runners: list[E2ERunner] = []
+    for grid_label, grid_args in grid_product(grid):
+        suffix = f" ({grid_label})" if grid_label != "" else ""
+        for axis in axes:
+            for label, args in axis['values']:
+                for target in targets:
+                    runners.append(E2ERunner(name=f"{axis['title']} {label}{suffix}",
+                                             dataset=target['dataset'],
+                                             detector_builder_2=target['builder'],
+                                             db2_args={**args, **grid_args},
+                                             impact_dilation=impact_dilation,
+                                             plots=plots,
+                                             max_plots=max_plots))
+    return runners
+
+
+# Which runners need to run, and for every runner the index of the one that gives its results
+def plan_sweep(runners: list[E2ERunner]) -> (list[E2ERunner], list[int]):
+    unique: list[E2ERunner] = []
+    by_key: dict[str, int] = {}
+    sources: list[int] = []
+    for r in runners:
+        key = r.get_config_key()
+        if key not in by_key:
+            by_key[key] = len(unique)
+            unique.append(r)
+        sources.append(by_key[key])
+    models = set(r.get_model_key() for r in unique) - {None}
+    print(f"Sweep of {len(runners)} configurations: {len(unique)} distinct, {len(models)} models to train")
+    return unique, sources
+
+
+# Same as execute_runners, but every distinct configuration only runs once
+def run_sweep(pool, runners: list[E2ERunner],
+              fanout: int = 8) -> list[tuple[int, E2ERunner, E2ERunnerResult]]:
+    unique, sources = plan_sweep(runners)
+    results = execute_runners(pool, unique, fanout)
+    return [(id, r, results[sources[id]][2]) for id, r in enumerate(runners)]
@@ -2,12 +2,16 @@ import typing
 from typing import Callable
 from sensor_data_types import *
 from splitter import *
+from snippet_pack import open_pack, snippet_hash, default_pack_path
+from snippet_catalog import open_catalog, default_catalog_path
+import os
 import pickle
 import hashlib
 import pandas as pd
 import numpy as np
 
-def sdi_save(sdi: SwingDataInstance) -> str:
+# source is the recording the snippet was cut from and impact where in it the impact was
+def sdi_save(sdi: SwingDataInstance, source: str | None = None, impact: int | None = None) -> str:
     base_path = "dataset/"
     subdirectory_parts = []
     if sdi['swing_type'] is None:
@@ -29,6 +33,13 @@ def sdi_save(sdi: SwingDataInstance) -> str:
             case WornHand.DOMINANT:
                 subdirectory_parts.append("dm")
 
+    # Keep the packed dataset up to date if there is one. Snippets of another length, like whole recordings,
+    # can't go in it, they are only kept as files and loaded from them.
+    pack = open_pack()
+    if pack is not None and not pack.fits(sdi):
+        print(f"Not packing the SDI, the pack only has snippets {pack.snippet_length()} samples long")
+        pack = None
+
     subdirectory = f"{'_'.join(subdirectory_parts)}/"
     pickled = pickle.dumps(sdi, fix_imports=False)
     md5_hash = hashlib.md5(pickled).hexdigest()
@@ -37,22 +48,123 @@ def sdi_save(sdi: SwingDataInstance) -> str:
     with open(filename, "wb") as file:
         file.write(pickled)
     print(f"Saved SDI to {filename}!")
+    catalog = open_catalog()
+    catalog.add(filename, md5_hash, '_'.join(subdirectory_parts), sdi, source=source, impact=impact,
+                packed=pack is not None)
+    catalog.close()
+    if pack is not None:
+        pack.append([sdi], [md5_hash])
     return filename
 
 
+def sdi_delete(filename: str):
+    print(f"Deleting {filename}...")
+    os.remove(filename)
+    catalog = open_catalog()
+    catalog.remove(snippet_hash(filename))
+    catalog.close()
+    pack = open_pack()
+    if pack is not None:
+        pack.remove(snippet_hash(filename))
+
+
+# Keeps the file as .pck.deactivated, but takes the snippet out of the dataset like sdi_delete
+def sdi_deactivate(filename: str):
+    new_name = f"{filename}.deactivated"
+    print(f"Renaming {filename} to {new_name}")
+    os.rename(filename, new_name)
+    catalog = open_catalog()
+    catalog.remove(snippet_hash(filename))
+    catalog.close()
+    pack = open_pack()
+    if pack is not None:
+        pack.remove(snippet_hash(filename))
+
+
 def sdi_load(filename: str) -> SwingDataInstance:
     return pickle.load(open(filename, 'rb'))
 
 
-def sdi_load_split(filename: str) -> (list[SwingDataInstance], list[SwingDataInstance],):
+# Loads snippets straight into a (instances, channels, length) panel.
+# Only what would survive post-processing is read: snippets of classes that skd_post_process would
+# remove with the same classes_to_remove and class_remap are skipped, and only the given channels
+# and samples are kept. Classes are returned as they are stored, without the remap.
+# Uses the packed dataset when it has all of them, otherwise unpickles them one by one.
+def sdi_load_panel(filenames: list[str],
+                   classes_to_remove: list[int] = [],
+                   class_remap: typing.Mapping[int, int] = {},
+                   crop_series_rows: slice = None,
+                   channels: list[str] = SAMPLE_CHANNELS,
+                   pack_path: str = default_pack_path) -> (np.ndarray, list[int]):
+    def is_kept(c: int) -> bool:
+        return class_remap.get(c, c) not in classes_to_remove
+
+    channel_idxs = [SAMPLE_CHANNELS.index(name) for name in channels]
+    hashes = [snippet_hash(f) for f in filenames]
+
+    pack = open_pack(pack_path)
+    if pack is not None:
+        rows = pack.find(hashes)
+        if rows is not None:
+            rows = rows[np.array([is_kept(c) for c in pack.classes(rows)], dtype=bool)]
+            return pack.load(rows, channel_idxs, crop_series_rows)
+
+    # Without a pack the catalog can still tell which files don't need to be unpickled
+    known_classes = {}
+    if os.path.exists(default_catalog_path):
+        catalog = open_catalog()
+        known_classes = catalog.classes(hashes)
+        catalog.close()
+
+    crop = crop_series_rows if crop_series_rows is not None else slice(None)
+    data = []
+    classes: list[int] = []
+    for f, h in zip(filenames, hashes):
+        if h in known_classes and not is_kept(known_classes[h]):
+            continue
+        sdi = sdi_load(f)
+        if not is_kept(sdi['class_id']):
+            continue
+        data.append([np.asarray(sdi[name], dtype='float64')[crop] for name in channels])
+        classes.append(sdi['class_id'])
+    if len(data) == 0:
+        return np.empty((0, len(channels), 0), dtype='float64'), classes
+    return np.array(data, dtype='float64'), classes
+
+
+
+def sdi_load_split(filename: str, load_test: bool = True,
+                   load_train: bool = True) -> (list[SwingDataInstance], list[SwingDataInstance],):
     split_data = load_split(filename)
-    print("Loading training data...")
-    train_sdi: list[SwingDataInstance] = [sdi_load(x) for x in split_data['train']]
-    print("Loading testing data...")
-    test_sdi: list[SwingDataInstance] = [sdi_load(x) for x in split_data['test']]
+    train_sdi: list[SwingDataInstance] = []
+    if load_train:
+        print("Loading training data...")
+        train_sdi = [sdi_load(x) for x in split_data['train']]
+    test_sdi: list[SwingDataInstance] = []
+    if load_test:
+        print("Loading testing data...")
+        test_sdi = [sdi_load(x) for x in split_data['test']]
     return train_sdi, test_sdi
 
 
+# sdi_load_split straight to panels, reading only what is used, see sdi_load_panel.
+# A half that isn't loaded is returned as None.
+def sdi_load_split_panels(filename: str, load_test: bool = True, load_train: bool = True,
+                          classes_to_remove: list[int] = [],
+                          class_remap: typing.Mapping[int, int] = {},
+                          crop_series_rows: slice = None,
+                          channels: list[str] = SAMPLE_CHANNELS) -> (tuple | None, tuple | None,):
+    split_data = load_split(filename)
+    train = None
+    if load_train:
+        print("Loading training data...")
+        train = sdi_load_panel(split_data['train'], classes_to_remove, class_remap, crop_series_rows, channels)
+    test = None
+    if load_test:
+        print("Loading testing data...")
+        test = sdi_load_panel(split_data['test'], classes_to_remove, class_remap, crop_series_rows, channels)
+    return train, test
+
 def sdiList2sktimeData(sdil: list[SwingDataInstance]) -> (pd.DataFrame, list[int]):
     data = {
         "arm_gyro_x": [],
@@ -79,124 +191,198 @@ def sdiList2sktimeData(sdil: list[SwingDataInstance]) -> (pd.DataFrame, list[int
     return df, classes
 
 
+# Same data as sdiList2sktimeData, as a (instances, channels, length) array with SAMPLE_CHANNELS as channels
+def sdiList2panel(sdil: list[SwingDataInstance]) -> (np.ndarray, list[int]):
+    if len(sdil) == 0:
+        panel = np.empty((0, len(SAMPLE_CHANNELS), 0), dtype='float64')
+    else:
+        panel = np.array([[np.asarray(sdi[name], dtype='float64') for name in SAMPLE_CHANNELS] for sdi in sdil],
+                         dtype='float64')
+    classes: list[int] = [sdi['class_id'] for sdi in sdil]
+    return panel, classes
+
+
+# Nested DataFrame to a (instances, channels, length) array, assumes all series are of equal length
+def sktimeData2panel(df: pd.DataFrame) -> np.ndarray:
+    if len(df) == 0:
+        return np.empty((0, len(df.columns), 0), dtype='float64')
+    return np.stack([np.stack([np.asarray(x, dtype='float64') for x in df[name]]) for name in df.columns], axis=1)
+
+
+def panel2sktimeData(panel: np.ndarray, channels: list[str]) -> pd.DataFrame:
+    return pd.DataFrame({name: [pd.Series(data=row, dtype='float64') for row in panel[:, idx]]
+                         for idx, name in enumerate(channels)})
+
+
+# Same result as calling np.linalg.norm([x[i], y[i], z[i]]) for every element, down to the last bit
+def norm3(x: np.ndarray, y: np.ndarray, z: np.ndarray) -> np.ndarray:
+    v = np.stack([x, y, z], axis=-1)
+    return np.sqrt((v[..., None, :] @ v[..., :, None])[..., 0, 0])
+
+
 class DimensionSynth:
+    # Channels the synthesized dimension is computed from
+    channels: list[str] = []
+
     def get_name(self) -> str:
         pass
 
-    def get_series(self, src) -> pd.Series:
+    # Computes the dimension for every instance at once. Channels are (instances, length) arrays
+    def get_array(self, channels: typing.Mapping[str, np.ndarray]) -> np.ndarray:
         pass
 
+    # Computes the dimension for a single DataFrame row
+    def get_series(self, src) -> pd.Series:
+        channels = {name: np.asarray(getattr(src, name), dtype='float64')[None, :] for name in self.channels}
+        return pd.Series(data=self.get_array(channels)[0], dtype='float64')
+
+    # Computes the dimension for every row of a DataFrame, one Series per row
+    def get_column(self, df: pd.DataFrame) -> list[pd.Series]:
+        if len(df) == 0:
+            return []
+        try:
+            channels = {name: np.stack([np.asarray(x, dtype='float64') for x in df[name]]) for name in self.channels}
+        except ValueError:
+            # Series of different lengths, can't be stacked
+            return [self.get_series(r) for r in df.itertuples(index=False)]
+        return [pd.Series(data=v, dtype='float64') for v in self.get_array(channels)]
+
 
 class PalmGyroNormSynth(DimensionSynth):
+    channels = ["palm_gyro_x", "palm_gyro_y", "palm_gyro_z"]
+
     def __str__(self):
         return self.get_name()
 
     def get_name(self) -> str:
         return "palm_gyro_norm"
 
-    def get_series(self, src) -> pd.Series:
-        palm_x: pd.Series = src.palm_gyro_x
-        palm_y: pd.Series = src.palm_gyro_y
-        palm_z: pd.Series = src.palm_gyro_z
-
-        values = []
-        for i in range(len(palm_x)):  # Assume all series are of equal length (if they aren't that's bad!)
-            values.append(np.linalg.norm([palm_x[i], palm_y[i], palm_z[i]]))
-
-        return pd.Series(data=values, dtype='float64')
+    def get_array(self, channels: typing.Mapping[str, np.ndarray]) -> np.ndarray:
+        return norm3(channels["palm_gyro_x"], channels["palm_gyro_y"], channels["palm_gyro_z"])
 
 
 class ArmGyroNormSynth(DimensionSynth):
+    channels = ["arm_gyro_x", "arm_gyro_y", "arm_gyro_z"]
+
     def __str__(self):
         return self.get_name()
 
     def get_name(self) -> str:
         return "arm_gyro_norm"
 
-    def get_series(self, src) -> pd.Series:
-        arm_x: pd.Series = src.arm_gyro_x
-        arm_y: pd.Series = src.arm_gyro_y
-        arm_z: pd.Series = src.arm_gyro_z
-
-        values = []
-        for i in range(len(arm_x)):  # Assume all series are of equal length (if they aren't that's bad!)
-            values.append(np.linalg.norm([arm_x[i], arm_y[i], arm_z[i]]))
-
-        return pd.Series(data=values, dtype='float64')
+    def get_array(self, channels: typing.Mapping[str, np.ndarray]) -> np.ndarray:
+        return norm3(channels["arm_gyro_x"], channels["arm_gyro_y"], channels["arm_gyro_z"])
 
 
 class PalmAccDifSynth(DimensionSynth):
+    channels = ["palm_acc_x", "palm_acc_y", "palm_acc_z"]
+
     def __str__(self):
         return self.get_name()
 
     def get_name(self) -> str:
         return "arm_acc_dif"
 
-    def get_series(self, src) -> pd.Series:
-        palm_x: pd.Series = src.palm_acc_x
-        palm_y: pd.Series = src.palm_acc_y
-        palm_z: pd.Series = src.palm_acc_z
-
-        values = []
-        last_acc = None
-        for i in range(len(palm_x)):  # Assume all series are of equal length (if they aren't that's bad!)
-            if last_acc is not None:
-                values.append(np.linalg.norm(
-                    [palm_x[i] - last_acc[0],
-                     palm_y[i] - last_acc[1],
-                     palm_z[i] - last_acc[2]]))
-
-            if len(values) == 1:
-                # Duplicate the first to fix 1 sample offset
-                values.append(values[0])
-            last_acc = [palm_x[i], palm_y[i], palm_z[i]]
-
-        return pd.Series(data=values, dtype='float64')
+    def get_array(self, channels: typing.Mapping[str, np.ndarray]) -> np.ndarray:
+        difs = norm3(np.diff(channels["palm_acc_x"]), np.diff(channels["palm_acc_y"]), np.diff(channels["palm_acc_z"]))
+        # Duplicate the first to fix 1 sample offset
+        return np.concatenate([difs[..., :1], difs], axis=-1)
 
 
+# DataFrame version of skd_array_post_process, kept for callers that still work on nested DataFrames.
+# Converting to a panel and back costs about as much as the old DataFrame code did, so it is no faster,
+# use skd_array_post_process where possible. Rows keep their labels in df's index, like DataFrame.drop did.
 def skd_post_process(df: pd.DataFrame, cl: list[int],
                      crop_series_rows: slice = None,
                      synthesize_dimensions: list[DimensionSynth] = [],
                      classes_to_remove: list[int] = [],
                      class_remap: typing.Mapping[int, int] = {},
                      dimensions_to_remove: list[str] = []) -> pd.DataFrame:
-    cf = df
-
-    # Remap classes in class list
-    for idx, c in enumerate(cl):
-        if c in class_remap.keys():
-            cl[idx] = class_remap[c]
-
-    # Remove specified classes from dataset
-    # 1. Find indexes on the classes
-    idx_to_remove = []
-    for idx, c in enumerate(cl):
-        if c in classes_to_remove:
-            idx_to_remove.append(idx)
+    # Done on arrays, assumes all series are of equal length (if they aren't that's bad!)
+    channels = list(df.columns)
+    classes, keep = skd_array_classes(cl, classes_to_remove, class_remap)
+    panel, _ = skd_array_post_process(sktimeData2panel(df)[keep],
+                                      crop_series_rows=crop_series_rows,
+                                      synthesize_dimensions=synthesize_dimensions,
+                                      dimensions_to_remove=dimensions_to_remove,
+                                      channels=channels)
+    # Callers expect the class list to be updated in place
+    cl[:] = classes.tolist()
+    cf = panel2sktimeData(panel, skd_array_channels(channels, synthesize_dimensions, dimensions_to_remove))
+    cf.index = df.index[keep]
+    return cf
 
-    # 2. Remove the rows from DataFrame
-    cf = cf.drop(idx_to_remove, axis=0)
 
-    # 3. Remove the rows from class list
-    idx_to_remove.sort(reverse=True)  # Start removing from back indexes so the changes in order have no impact
-    for idx in idx_to_remove:
-        cl.pop(idx)
+# Channel names of a panel after skd_array_post_process
+def skd_array_channels(channels: list[str],
+                       synthesize_dimensions: list[DimensionSynth] = [],
+                       dimensions_to_remove: list[str] = []) -> list[str]:
+    # Every synthesized dimension is inserted as the first channel
+    names = [d.get_name() for d in reversed(synthesize_dimensions)] + list(channels)
+    missing = [n for n in dimensions_to_remove if n not in names]
+    if len(missing) > 0:
+        raise KeyError(f"{missing} not found in channels")
+    return [n for n in names if n not in dimensions_to_remove]
+
+
+# Channels that have to be loaded for skd_array_post_process: the ones that are kept and the ones
+# synthesized dimensions are made from. Also returns dimensions_to_remove without the channels that
+# won't be loaded at all, to pass to skd_array_post_process along with them.
+def skd_array_source_channels(synthesize_dimensions: list[DimensionSynth] = [],
+                              dimensions_to_remove: list[str] = [],
+                              channels: list[str] = SAMPLE_CHANNELS) -> (list[str], list[str]):
+    used = set(n for d in synthesize_dimensions for n in d.channels)
+    needed = [n for n in channels if n not in dimensions_to_remove or n in used]
+    return needed, [n for n in dimensions_to_remove if n in needed or n not in channels]
+
+
+# Remapped classes of the instances that are kept, and which instances those are
+def skd_array_classes(cl: np.ndarray | list[int],
+                      classes_to_remove: list[int] = [],
+                      class_remap: typing.Mapping[int, int] = {}) -> (np.ndarray, np.ndarray):
+    original = np.asarray(cl, dtype='int64')
+    # Remap classes, every class at most once
+    classes = original.copy()
+    for c, new_c in class_remap.items():
+        classes[original == c] = new_c
 
-    # Apply slicing if provided
+    # Remove specified classes from dataset
+    keep = ~np.isin(classes, list(classes_to_remove))
+    return classes[keep], keep
+
+
+# skd_post_process for a (instances, channels, length) panel and its classes.
+# Classes can be None when there are none, like for windows that are being classified.
+def skd_array_post_process(panel: np.ndarray,
+                           cl: np.ndarray | list[int] | None = None,
+                           crop_series_rows: slice = None,
+                           synthesize_dimensions: list[DimensionSynth] = [],
+                           classes_to_remove: list[int] = [],
+                           class_remap: typing.Mapping[int, int] = {},
+                           dimensions_to_remove: list[str] = [],
+                           channels: list[str] = SAMPLE_CHANNELS) -> (np.ndarray, np.ndarray | None):
+    classes = None
+    if cl is not None:
+        classes, keep = skd_array_classes(cl, classes_to_remove, class_remap)
+        if not keep.all():
+            panel = panel[keep]
+
+    # Apply slicing if provided, a view so nothing is copied yet
     if crop_series_rows is not None:
-        # Unoptimized shit because a pd.Series slice retains indexing, but we need it to start from 0
-        cf = cf.applymap(lambda x: pd.Series(data=x.tolist()[crop_series_rows]))
+        panel = panel[:, :, crop_series_rows]
 
     # Synthesize dimensions
     # Do it now so we don't calculate them for unnecessary rows
+    names = list(channels)
+    columns = [panel[:, idx] for idx in range(len(names))]
     for d in synthesize_dimensions:
-        new_column_name = d.get_name()
-        new_column = []
-        for r in cf.itertuples(index=False):
-            new_column.append(d.get_series(r))
-        cf.insert(0, new_column_name, new_column)
+        synthesized = d.get_array(dict(zip(names, columns)))
+        names.insert(0, d.get_name())
+        columns.insert(0, synthesized)
 
     # Remove specified dimensions
-    cf = cf.drop(dimensions_to_remove, axis=1)
-
-    return cf
+    kept = skd_array_channels(channels, synthesize_dimensions, dimensions_to_remove)
+    columns = [columns[names.index(n)] for n in kept]
+    if len(columns) == 0:
+        return np.empty((panel.shape[0], 0, panel.shape[2]), dtype='float64'), classes
+    return np.stack(columns, axis=1), classes
@@ -5,7 +5,7 @@ from matplotlib.figure import Figure
 from matplotlib.axes import Axes
 from matplotlib.lines import Line2D
 from sklearn.metrics import confusion_matrix, ConfusionMatrixDisplay
-from sensor_data_types import WristSample
+from sensor_data_types import WristSample, SampleBlock, wristSample2sampleBlock
 
 
 def num_to_text_label(num_label):
@@ -31,40 +31,44 @@ _z_ls = ":"
 _lthicc = 1.5
 
 
-def plot_arm_acceleration(samples: list[WristSample], ax: Axes) -> list[Line2D]:
-    xx = [x for x in map(lambda x: x['arm_acc'][0], samples)]
-    yy = [x for x in map(lambda x: x['arm_acc'][1], samples)]
-    zz = [x for x in map(lambda x: x['arm_acc'][2], samples)]
+def plot_arm_acceleration(samples: list[WristSample] | SampleBlock, ax: Axes) -> list[Line2D]:
+    values = wristSample2sampleBlock(samples).arm_acc
+    xx = values[:, 0]
+    yy = values[:, 1]
+    zz = values[:, 2]
     x_line = ax.plot(xx, 'r', label="Paātrinājums X", linestyle=_x_ls, linewidth=_lthicc)
     y_line = ax.plot(yy, 'g', label="Paātrinājums Y", linestyle=_y_ls, linewidth=_lthicc)
     z_line = ax.plot(zz, 'b', label="Paātrinājums Z", linestyle=_z_ls, linewidth=_lthicc)
     return [x_line[0], y_line[0], z_line[0]]
 
 
-def plot_arm_rotation(samples: list[WristSample], ax: Axes) -> list[Line2D]:
-    xx = [x for x in map(lambda x: x['arm_gyro'][0], samples)]
-    yy = [x for x in map(lambda x: x['arm_gyro'][1], samples)]
-    zz = [x for x in map(lambda x: x['arm_gyro'][2], samples)]
+def plot_arm_rotation(samples: list[WristSample] | SampleBlock, ax: Axes) -> list[Line2D]:
+    values = wristSample2sampleBlock(samples).arm_gyro
+    xx = values[:, 0]
+    yy = values[:, 1]
+    zz = values[:, 2]
     x_line = ax.plot(xx, 'r', label="Leņķ. ātrums X", linestyle=_x_ls, linewidth=_lthicc)
     y_line = ax.plot(yy, 'g', label="Leņķ. ātrums Y", linestyle=_y_ls, linewidth=_lthicc)
     z_line = ax.plot(zz, 'b', label="Leņķ. ātrums Z", linestyle=_z_ls, linewidth=_lthicc)
     return [x_line[0], y_line[0], z_line[0]]
 
 
-def plot_palm_acceleration(samples: list[WristSample], ax: Axes) -> list[Line2D]:
-    xx = [x for x in map(lambda x: x['palm_acc'][0], samples)]
-    yy = [x for x in map(lambda x: x['palm_acc'][1], samples)]
-    zz = [x for x in map(lambda x: x['palm_acc'][2], samples)]
+def plot_palm_acceleration(samples: list[WristSample] | SampleBlock, ax: Axes) -> list[Line2D]:
+    values = wristSample2sampleBlock(samples).palm_acc
+    xx = values[:, 0]
+    yy = values[:, 1]
+    zz = values[:, 2]
     x_line = ax.plot(xx, 'r', label="Paātrinājums X", linestyle=_x_ls, linewidth=_lthicc)
     y_line = ax.plot(yy, 'g', label="Paātrinājums Y", linestyle=_y_ls, linewidth=_lthicc)
     z_line = ax.plot(zz, 'b', label="Paātrinājums Z", linestyle=_z_ls, linewidth=_lthicc)
     return [x_line[0], y_line[0], z_line[0]]
 
 
-def plot_palm_rotation(samples: list[WristSample], ax: Axes) -> list[Line2D]:
-    xx = [x for x in map(lambda x: x['palm_gyro'][0], samples)]
-    yy = [x for x in map(lambda x: x['palm_gyro'][1], samples)]
-    zz = [x for x in map(lambda x: x['palm_gyro'][2], samples)]
+def plot_palm_rotation(samples: list[WristSample] | SampleBlock, ax: Axes) -> list[Line2D]:
+    values = wristSample2sampleBlock(samples).palm_gyro
+    xx = values[:, 0]
+    yy = values[:, 1]
+    zz = values[:, 2]
     x_line = ax.plot(xx, 'r', label="Leņķ. ātrums X", linestyle=_x_ls, linewidth=_lthicc)
     y_line = ax.plot(yy, 'g', label="Leņķ. ātrums Y", linestyle=_y_ls, linewidth=_lthicc)
     z_line = ax.plot(zz, 'b', label="Leņķ. ātrums Z", linestyle=_z_ls, linewidth=_lthicc)
@@ -78,7 +82,7 @@ def plot_markers(markers: list[int], ax: Axes, color, style) -> list[Line2D]:
     return ret
 
 
-def plot_samples(samples: list[WristSample],
+def plot_samples(samples: list[WristSample] | SampleBlock,
                  det_markers: list[int] = [],
                  truth_markers: list[int] = [],
                  legend: bool = True,
@@ -91,6 +95,7 @@ def plot_samples(samples: list[WristSample],
         fig.set_size_inches(14, 8)
     else:
         ax = in_place_axes
+    samples = wristSample2sampleBlock(samples)
     plot_arm_acceleration(samples, ax[0, 0])
     plot_arm_rotation(samples, ax[1, 0])
     plot_palm_acceleration(samples, ax[0, 1])